@@ -0,0 +1,152 @@
+'''
+generators of synthetic inputs of given sizes for the benchmarks
+'''
+
+import json
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED
+from docal.document.word import default_template
+
+BODY_START = '<w:body>'
+BODY_END = '<w:sectPr'
+
+
+def script(n_statements: int) -> str:
+    '''a script with mixed assignments, text, options and other code'''
+    lines = ['from math import *', 'x_0 = 1.5 #m', 'y_0 = 2 #N', 'd_0 = 0.1 #m']
+    # the last x assigned
+    last = 0
+    for i in range(1, n_statements):
+        kind = i % 10
+        if kind == 0:
+            lines.append(f'# the values of step {i} with #x_{last} and $x_{last}/2$')
+        elif kind == 1:
+            lines.append(f'#@ d{2 + i % 3}')
+        elif kind == 2:
+            lines.append(f'for k in range(3): z_{i} = k')
+        elif kind == 4:
+            lines.append(f'y_{i} = y_0 * x_{last} / (d_0 + x_{last}) #13')
+        else:
+            if kind == 3:
+                lines.append(f'x_{i} = sqrt(x_{last} ** 2 + d_0 ** 2)')
+            else:
+                lines.append(f'x_{i} = x_{last} * 1.001 + d_0 * sin({i}) ** 2')
+            last = i
+    return '\n'.join(lines)
+
+
+def matrix_script(size: int) -> str:
+    '''a script with numpy matrices of the given size'''
+    return '\n'.join([
+        'import numpy as np',
+        f'A = np.arange({size * size}).reshape({size}, {size}) / 7',
+        'B = A @ A.T',
+        'v = A[:, 0]',
+        'w = B @ v',
+        f'C = A[:{size // 2}] * 2 #m50',
+    ])
+
+
+def tagged_script(n_tags: int) -> str:
+    '''a script that sends to the tags of a generated document'''
+    lines = []
+    for i in range(n_tags):
+        lines.append(f'#s{i}')
+        lines.append(f'x{i} = {i} * 2 #m')
+        if i % 10 == 0:
+            lines.append(f't{i} = [[{i}, 2, 3], [4, 5, 6]]')
+    return '\n'.join(lines)
+
+
+def table_script(n_rows: int, n_cols: int) -> str:
+    '''a script that fills the table tag of a document of one tag (see docx)'''
+    return '\n'.join([
+        'import numpy as np',
+        tagged_script(1),
+        f't0 = np.linspace(-1e4, 1e4, {n_rows * n_cols}).reshape({n_rows}, {n_cols}) ** 3 / 1e8',
+    ])
+
+
+def _paragraph(text: str) -> str:
+    if not text:
+        return '<w:p/>'
+    return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def _table(first_cell: str, rows: int, cols: int) -> str:
+    trs = []
+    for i_row in range(rows):
+        tcs = []
+        for i_col in range(cols):
+            text = first_cell if i_row == i_col == 0 else ''
+            tcs.append(f'<w:tc><w:tcPr><w:tcW w:w="2000" w:type="dxa"/></w:tcPr>{_paragraph(text)}</w:tc>')
+        trs.append('<w:tr>' + ''.join(tcs) + '</w:tr>')
+    return '<w:tbl><w:tblPr><w:tblW w:w="0" w:type="auto"/></w:tblPr>' + ''.join(trs) + '</w:tbl>'
+
+
+def docx(filename: str, n_tags: int):
+    '''
+    a Word document with a block tag and a paragraph with an inline tag for
+    each, and a table tag every 10 (see tagged_script)
+    '''
+    body = []
+    for i in range(n_tags):
+        body.append(_paragraph(f'#s{i}'))
+        body.append(_paragraph(f'The value of x{i} is #x{i} in the text.'))
+        if i % 10 == 0:
+            body.append(_table(f'#t{i}', 3, 3))
+    with ZipFile(filename, 'w', ZIP_DEFLATED) as zout:
+        with ZipFile(BytesIO(default_template())) as zin:
+            for item in zin.infolist():
+                data = zin.read(item.filename)
+                if item.filename == 'word/document.xml':
+                    xml = data.decode('utf-8')
+                    start = xml.index(BODY_START) + len(BODY_START)
+                    data = (xml[:start] + ''.join(body) + xml[xml.index(BODY_END):]).encode('utf-8')
+                zout.writestr(item, data)
+
+
+def tex(filename: str, n_tags: int):
+    '''a LaTeX document with a block tag for each (see tagged_script)'''
+    body = [f'Section {i}\n\n#s{i}\n' for i in range(n_tags)]
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write('\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n'
+                   + '\n'.join(body) + '\n\\end{document}\n')
+
+
+def xlsx(filename: str, n_rows: int):
+    '''a workbook with a variable name, a value or formula and a unit in each row'''
+    strings = []
+    rows = []
+    for i in range(1, n_rows + 1):
+        cells = [f'<c r="A{i}" t="s"><v>{len(strings)}</v></c>']
+        strings.append(f'x_{i}')
+        if i == 1:
+            cells.append(f'<c r="B{i}"><v>{i}</v></c>')
+        else:
+            cells.append(f'<c r="B{i}"><f>B{i - 1}*2</f><v>{i}</v></c>')
+        cells.append(f'<c r="C{i}" t="s"><v>{len(strings)}</v></c>')
+        strings.append('m')
+        rows.append(f'<row r="{i}">' + ''.join(cells) + '</row>')
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    with ZipFile(filename, 'w', ZIP_DEFLATED) as zout:
+        zout.writestr('xl/worksheets/sheet1.xml',
+                      f'<worksheet {ns}><sheetData>' + ''.join(rows) + '</sheetData></worksheet>')
+        zout.writestr('xl/sharedStrings.xml',
+                      f'<sst {ns}>' + ''.join(f'<si><t>{s}</t></si>' for s in strings) + '</sst>')
+
+
+def dcl(filename: str, n_lines: int):
+    '''a dcl file with ascii and python blocks'''
+    ascii_lines = []
+    for i in range(n_lines):
+        if i % 5 == 0:
+            ascii_lines.append(f' the text of line {i}')
+        else:
+            ascii_lines.append(f'x_{i} = 2x_{i - 1 if i % 5 > 1 else 0}^2 + {i}')
+    data = {'data': [
+        {'type': 'python', 'data': ['x_0 = 0.5', 'z = x_0 ** 2']},
+        {'type': 'ascii', 'data': ascii_lines},
+    ]}
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
@@ -0,0 +1,240 @@
+'''
+benchmarks of each stage of the pipeline on generated inputs, compared with
+the results stored in baseline.json
+
+    python -m benchmarks.run            # run and compare with the baseline
+    python -m benchmarks.run --save     # store the results as the baseline
+    python -m benchmarks.run --quick    # skip the largest inputs
+    python -m benchmarks.run -k word    # only those with word in the name
+
+The times are the best of the repeats, in seconds. They depend on the
+machine, so the baseline should be saved on the one it is compared on.
+'''
+
+import ast
+import sys
+import json
+import logging
+import tempfile
+from os import path
+from time import perf_counter
+from argparse import ArgumentParser
+from docal import processor
+from docal.calculation import cal, _process_options
+from docal.parsing import MathVisitor, Comment, _get_parts
+from docal.document import word, latex
+from docal.parsers import excel, dcl
+from . import generate
+
+BASELINE = path.join(path.dirname(path.abspath(__file__)), 'baseline.json')
+# slower than the baseline by more than this is reported as a regression
+TOLERANCE = 1.25
+
+# name: (function, whether it is run with --quick). The function is called
+# with the directory of the generated files for each repeat and returns
+# what is timed, so that the rest is setup.
+BENCHMARKS = {}
+
+
+def benchmark(name: str, quick=True):
+    def register(func):
+        BENCHMARKS[name] = (func, quick)
+        return func
+    return register
+
+
+def _generated(directory: str, name: str, generator, *args) -> str:
+    '''the file made by the generator, made only the first time'''
+    filename = path.join(directory, name)
+    if not path.exists(filename):
+        generator(filename, *args)
+    return filename
+
+
+def _statements(n_statements: int) -> tuple[list, dict]:
+    '''the parts of a script, and the working dict after processing it'''
+    script = generate.script(n_statements)
+    proc = processor(latex.syntax())
+    proc.process(script)
+    return _get_parts(script), proc.working_dict
+
+
+for n in [10, 1000, 10000]:
+    @benchmark(f'parse-{n}', quick=n < 10000)
+    def _(directory, script=generate.script(n)):
+        return lambda: _get_parts(script)
+
+    @benchmark(f'process-{n}', quick=n < 10000)
+    def _(directory, script=generate.script(n)):
+        syntax = latex.syntax()
+        return lambda: processor(syntax).process(script)
+
+
+@benchmark('cal-1000')
+def _(directory):
+    script = generate.script(1000)
+    syntax = latex.syntax()
+    parts = _get_parts(script)
+    def run():
+        working_dict = {}
+        defaults = _process_options('')
+        for part in parts:
+            if isinstance(part, Comment):
+                if part.kind == 'options':
+                    defaults = _process_options(part.content)
+            elif isinstance(part, ast.Assign):
+                cal(part, working_dict, syntax=syntax, options=_process_options(part.options, defaults))
+            else:
+                exec(compile(ast.Module([part], []), '<calculation>', 'exec'), working_dict)
+    return run
+
+
+@benchmark('mathvisitor-1000')
+def _(directory):
+    parts, working_dict = _statements(1000)
+    syntax = latex.syntax()
+    exprs = [part.value for part in parts if isinstance(part, ast.Assign)]
+    def run():
+        for subs in [False, True]:
+            for expr in exprs:
+                MathVisitor(mul=' ', div='/', subs=subs, mat_size=10,
+                            working_dict=working_dict, syntax=syntax).render(expr)
+    return run
+
+
+@benchmark('matrix-200')
+def _(directory):
+    script = generate.matrix_script(200)
+    syntax = latex.syntax()
+    return lambda: processor(syntax).process(script)
+
+
+def _word_document(directory: str, n_tags: int):
+    '''a word document of the generated file and what to write in it'''
+    infile = _generated(directory, f'tags-{n_tags}.docx', generate.docx, n_tags)
+    doc = word.document(infile, path.join(directory, f'tags-{n_tags}-out.docx'))
+    proc = processor(word.syntax(), doc.tags)
+    proc.send(generate.tagged_script(n_tags))
+    return doc, proc.contents
+
+
+for n in [100, 2000]:
+    @benchmark(f'word-init-{n}', quick=n < 2000)
+    def _(directory, n=n):
+        infile = _generated(directory, f'tags-{n}.docx', generate.docx, n)
+        return lambda: word.document(infile, path.join(directory, f'tags-{n}-out.docx'))
+
+    @benchmark(f'word-subs-tags-{n}', quick=n < 2000)
+    def _(directory, n=n):
+        doc, contents = _word_document(directory, n)
+        pairs = [(tag, part) for tag, parts in contents.items() for part in parts]
+        return lambda: doc._subs_tags(*doc._convert(pairs))
+
+    @benchmark(f'word-write-{n}', quick=n < 2000)
+    def _(directory, n=n):
+        doc, contents = _word_document(directory, n)
+        doc._subs_tags(*doc._convert((tag, part) for tag, parts in contents.items() for part in parts))
+        # only the rest of writing
+        doc._subs_tags = lambda paras, tables: None
+        return lambda: doc.write({})
+
+    @benchmark(f'word-template-{n}', quick=n < 2000)
+    def _(directory, n=n):
+        doc, contents = _word_document(directory, n)
+        compiled = word.template(doc.infile)
+        pairs = [(tag, part) for tag, parts in contents.items() for part in parts]
+        # made and written from the template each time
+        return lambda: compiled.document(path.join(directory, f'tags-{n}-out.docx')).write(pairs)
+
+    @benchmark(f'latex-write-{n}', quick=n < 2000)
+    def _(directory, n=n):
+        infile = _generated(directory, f'tags-{n}.tex', generate.tex, n)
+        doc = latex.document(infile, path.join(directory, f'tags-{n}-out.tex'))
+        proc = processor(latex.syntax(), doc.tags)
+        proc.send(generate.tagged_script(n))
+        return lambda: doc.write(proc.contents)
+
+
+@benchmark('word-table-20000')
+def _(directory):
+    infile = _generated(directory, 'tags-1.docx', generate.docx, 1)
+    doc = word.document(infile, path.join(directory, 'tags-1-out.docx'))
+    script = generate.table_script(200, 100)
+    def run():
+        proc = processor(word.syntax(), doc.tags)
+        proc.send(script)
+        doc._subs_tags(*doc._convert((tag, part) for tag, parts in proc.contents.items() for part in parts))
+    return run
+
+
+for n in [100, 5000]:
+    @benchmark(f'excel-parse-{n}', quick=n < 5000)
+    def _(directory, n=n):
+        infile = _generated(directory, f'sheet-{n}.xlsx', generate.xlsx, n)
+        return lambda: excel.parse(infile)
+
+    @benchmark(f'dcl-parse-{n}', quick=n < 5000)
+    def _(directory, n=n):
+        infile = _generated(directory, f'calc-{n}.dcl', generate.dcl, n)
+        return lambda: dcl.parse(infile)
+
+
+def run(names: list[str], repeat: int) -> dict[str, float]:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            times = []
+            for _ in range(repeat):
+                func = BENCHMARKS[name][0](directory)
+                start = perf_counter()
+                func()
+                times.append(perf_counter() - start)
+            results[name] = round(min(times), 6)
+            print(f'{name:<24}{results[name]:>10.4f}', file=sys.stderr)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float]) -> list[str]:
+    '''print the results beside the baseline, returning the slower ones'''
+    slower = []
+    print(f'{"benchmark":<24}{"baseline":>10}{"current":>10}{"ratio":>8}')
+    for name, time in results.items():
+        if name not in baseline:
+            print(f'{name:<24}{"-":>10}{time:>10.4f}')
+            continue
+        ratio = time / baseline[name]
+        mark = ''
+        if ratio > TOLERANCE:
+            slower.append(name)
+            mark = '  SLOWER'
+        print(f'{name:<24}{baseline[name]:>10.4f}{time:>10.4f}{ratio:>8.2f}{mark}')
+    return slower
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the stages of docal')
+    parser.add_argument('-k', '--filter', default='', help='Only run the benchmarks containing this')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='The number of times to run each')
+    parser.add_argument('--quick', action='store_true', help='Skip the largest inputs')
+    parser.add_argument('--save', action='store_true', help='Store the results as the baseline')
+    args = parser.parse_args()
+
+    logging.getLogger('docal').setLevel(logging.ERROR)
+    names = [name for name, (_, quick) in BENCHMARKS.items()
+             if args.filter in name and (quick or not args.quick)]
+    results = run(names, args.repeat)
+    baseline = {}
+    if path.exists(BASELINE):
+        with open(BASELINE, encoding='utf-8') as file:
+            baseline = json.load(file)
+    if args.save:
+        with open(BASELINE, 'w', encoding='utf-8') as file:
+            json.dump({**baseline, **results}, file, indent=2, sort_keys=True)
+            file.write('\n')
+        return
+    if compare(results, baseline):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
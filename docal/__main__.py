@@ -1,24 +1,26 @@
 '''
 script handler
 '''
-from argparse import ArgumentParser, BooleanOptionalAction
+import sys
 from os import path
-from docal import processor
-from docal.parsers import excel, dcl
-from docal.document import word, latex
+from argparse import ArgumentParser, BooleanOptionalAction, ArgumentTypeError
+from docal import jobs
 
 def calculation_file(arg: str) -> str:
     'check if the argument is a path to a python script'
-    if arg.endswith('.py') or arg.endswith('.xlsx') or arg.endswith('.dcl'):
+    extension = path.splitext(arg)[1]
+    if extension == '.py' or jobs.supported(jobs.PARSERS_GROUP, extension):
         return arg
-    raise ValueError("The calculation file name must end with '.py'.")
+    names = ', '.join(f"'{ext}'" for ext in ['.py', *jobs.extensions(jobs.PARSERS_GROUP)])
+    raise ArgumentTypeError(f"The calculation file name must end with one of {names}.")
 
 
 def document_file(arg: str) -> str:
     'same as above for documents'
-    if arg.endswith('.docx') or arg.endswith('.tex'):
+    if jobs.supported(jobs.HANDLERS_GROUP, path.splitext(arg)[1]):
         return arg
-    raise ValueError("The document names must end with '.docx' or '.tex'.")
+    names = ', '.join(f"'{ext}'" for ext in jobs.extensions(jobs.HANDLERS_GROUP))
+    raise ArgumentTypeError(f"The document names must end with one of {names}.")
 
 
 # command line arguments
@@ -27,59 +29,75 @@ parser = ArgumentParser(description="Process the script file, inject it to "
 parser.add_argument(
     'script', help='The calculation file/script', type=calculation_file, nargs='?')
 parser.add_argument(
-    '-i', '--input', help='The document file to be modified', type=document_file)
+    '-i', '--input', help='The document file to be modified. Can be given '
+    'more than once, for the outputs of the same kind', type=document_file, action='append')
 parser.add_argument(
-    '-o', '--output', help='The destination document file', type=document_file)
+    '-o', '--output', help='The destination document file. Can be given more '
+    'than once, to render the script once into all of them', type=document_file, action='append')
 parser.add_argument('-c', '--clear', action='store_true',
                     help='Clear the calculations and try to '
                     'revert the document to the previous state. '
                     'Only for the calculation ranges in LaTeX files.')
 parser.add_argument('--lsp', help='Start as LSP server', action=BooleanOptionalAction)
+parser.add_argument('-b', '--batch', metavar='MANIFEST',
+                    help='Run the jobs in the JSON file, a list of objects '
+                    'with the keys script, input and output')
+parser.add_argument('-j', '--jobs', type=int,
+                    help='The number of worker processes for --batch and --cases')
+parser.add_argument('--cases', metavar='CSV',
+                    help='Process the script for each case of the values of '
+                    'the variables in the CSV file, with their names in the '
+                    'first row. A document is produced for each case unless '
+                    '--table is given')
+parser.add_argument('--table', metavar='NAME',
+                    help='The table tag to fill with the results of all the '
+                    'cases of --cases')
+parser.add_argument('--profile', action='store_true',
+                    help='Show the time spent on each line, slowest first')
+parser.add_argument('--profile-json', metavar='FILE',
+                    help='Write the times of --profile to the JSON file, '
+                    'profiling even without it')
 parser.add_argument('-l', '--log-level', choices=['INFO', 'WARNING', 'ERROR', 'DEBUG'],
                     help='How much info you want to see')
 
 
-args = parser.parse_args()
+def report(errors: list[str]) -> int:
+    '''print the errors to stderr, returning the exit status'''
+    for error in errors:
+        print('ERROR:', error, file=sys.stderr)
+    return 1 if errors else 0
 
-handlers = {
-    '.tex': latex,
-    '.docx': word
-}
 
-def main():
+def main(argv: list[str] | None = None) -> int:
     '''
-    main function in this script
+    main function in this script, returning the exit status
     '''
+    args = parser.parse_args(argv)
     if args.lsp:
         from docal.lsp import server
         server.start_io()
-        return
-    extension_i = path.splitext(args.input)[1] if args.input else None
-    extension_o = path.splitext(args.output)[1] if args.output else None
+        return 0
     try:
-        handler = handlers[extension_i if extension_i else extension_o]
-        doc = handler.document(args.input, args.output)
-        proc = processor(handler.syntax(), doc.tags, args.log_level)
-        if not args.clear:
-            calculation = path.abspath(args.script)
-            kind = path.splitext(calculation)[1]
-            if kind == '.py':
-                with open(args.script, encoding='utf-8') as file:
-                    instructions = file.read()
-            elif kind == '.xlsx':
-                instructions = excel.parse(calculation)
-            elif kind == '.dcl':
-                instructions = dcl.parse(args.script)
-            else:
-                instructions = ''
-            proc.send(instructions)
-        doc.write(proc.contents)
+        if args.batch:
+            return report(jobs.run_jobs(jobs.read_manifest(args.batch), args.jobs, args.log_level))
+        if args.cases:
+            if len(args.input or []) > 1 or len(args.output or []) > 1:
+                raise ValueError('Only one input and one output document can be given with --cases.')
+            return report(jobs.run_sweep(args.script, args.cases, (args.input or [None])[0],
+                                         (args.output or [None])[0], args.table, args.jobs, args.log_level))
+        profile = jobs.run_job(args.script, args.input, args.output, args.clear, args.log_level,
+                               profile=args.profile or args.profile_json is not None)
+        if profile is not None:
+            print(profile.summary())
+            if args.profile_json:
+                with open(args.profile_json, 'w', encoding='utf-8') as file:
+                    file.write(profile.to_json())
     except Exception as exc:
         if args.log_level == 'DEBUG':
             raise
-        else:
-            print('ERROR:', str(exc))
+        return report([str(exc)])
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
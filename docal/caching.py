@@ -0,0 +1,242 @@
+'''
+module caching
+
+provides a persistent, size bounded store of the results of calculations so
+that unchanged statements need not be evaluated and rendered again between
+runs
+'''
+
+import ast
+import os
+import pickle
+import hashlib
+import logging
+import sysconfig
+from types import ModuleType, FunctionType, CodeType
+
+logger = logging.getLogger(__name__)
+
+# the default maximum total size of a cache directory
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+# the fraction of the maximum size to shrink to when evicting, so that
+# eviction is not needed on every new entry
+EVICT_TO = 0.9
+
+ENTRY_EXT = '.pickle'
+
+# modules installed here change only with their version, their files are
+# not read and the globals of their functions are not followed
+INSTALL_DIRS = tuple({os.path.join(os.path.realpath(sysconfig.get_path(name)), '')
+                      for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')})
+
+# the hashes of the files of modules, by their path, modification time and size
+_file_digests = {}
+
+
+def _const_data(const):
+    '''a representation of a code constant that does not vary between runs'''
+    if isinstance(const, CodeType):
+        return _code_data(const)
+    if isinstance(const, frozenset):
+        # the order of sets of strings changes with the hash seed
+        return sorted(map(repr, const))
+    if isinstance(const, tuple):
+        return [_const_data(c) for c in const]
+    return repr(const)
+
+
+def _code_data(code: CodeType) -> list:
+    '''what the behaviour of the code depends on, to hash it'''
+    return [code.co_code, [_const_data(c) for c in code.co_consts],
+            code.co_names, code.co_varnames, code.co_freevars]
+
+
+def _code_names(code: CodeType) -> set[str]:
+    '''the global (and attribute) names used in the code and the code nested in it'''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _installed(path: str) -> bool:
+    '''whether the file is of an installed module'''
+    return os.path.realpath(path).startswith(INSTALL_DIRS)
+
+
+def _module_data(module: ModuleType) -> list:
+    '''the name of the module with a hash of its file, so that editing it changes it'''
+    path = getattr(module, '__file__', None)
+    if path is None:
+        return [module.__name__]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [module.__name__, path]
+    stamp = (path, stat.st_mtime_ns, stat.st_size)
+    if _installed(path):
+        return [module.__name__, *stamp]
+    if stamp not in _file_digests:
+        try:
+            with open(path, 'rb') as file:
+                _file_digests[stamp] = hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return [module.__name__, *stamp]
+    return [module.__name__, _file_digests[stamp]]
+
+
+def _callable_data(value, seen: set) -> list | None:
+    '''
+    the code of the function, or of the methods of the class, with the values
+    it is defined with and the globals it reads, as they are pickled by
+    reference only
+    '''
+    if id(value) in seen:
+        # recursive references, like the class in the closures of its methods
+        return [value.__qualname__]
+    seen = seen | {id(value)}
+    data = [value.__module__, value.__qualname__]
+    if isinstance(value, FunctionType):
+        data.append(_code_data(value.__code__))
+        values = [value.__defaults__, value.__kwdefaults__]
+        values += [cell.cell_contents for cell in value.__closure__ or ()]
+        module = value.__globals__.get('__file__')
+        if module is not None and not _installed(module):
+            # the helpers and the data it uses, to follow their edits
+            names = sorted(_code_names(value.__code__) & value.__globals__.keys())
+            data.append(names)
+            values += [value.__globals__[name] for name in names]
+        for val in values:
+            val_data = _digest(val, seen)
+            if val_data is None:
+                return None
+            data.append(val_data)
+        return data
+    data += [_digest(base, seen) for base in value.__bases__]
+    for name, attr in sorted(vars(value).items()):
+        attr = getattr(attr, '__func__', attr)
+        if isinstance(attr, property):
+            attr = (attr.fget, attr.fset, attr.fdel)
+        # descriptors of builtin types cannot be hashed and are left out
+        data.append(f'{name}={_digest(attr, seen)}')
+    return data
+
+
+def _digest(value, seen: set) -> str | None:
+    if isinstance(value, ast.AST):
+        data = ast.dump(value).encode()
+    elif isinstance(value, ModuleType):
+        data = repr(_module_data(value)).encode()
+    elif isinstance(value, (FunctionType, type)):
+        callable_data = _callable_data(value, seen)
+        if callable_data is None:
+            return None
+        data = repr(callable_data).encode()
+    elif isinstance(value, tuple) and any(isinstance(v, (FunctionType, type)) for v in value):
+        digests = [_digest(v, seen) for v in value]
+        if None in digests:
+            return None
+        data = '\0'.join(digests).encode()
+    else:
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # like instances of classes defined in the script
+            return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def digest(value) -> str | None:
+    '''
+    a stable hash of the value, for use in cache keys. None if the value
+    cannot be hashed in a way that is stable across runs. functions and
+    classes are hashed with their code and modules with their files so that
+    editing them changes it
+    '''
+    return _digest(value, set())
+
+
+class ResultCache:
+    '''
+    a directory of pickled entries, where the least recently used entries
+    are removed when the total size exceeds max_size
+    '''
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        with os.scandir(self.directory) as entries:
+            return [e for e in entries if e.is_file() and e.name.endswith(ENTRY_EXT)]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_EXT)
+
+    @staticmethod
+    def key(*parts) -> str:
+        '''make a key from the given strings'''
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def get(self, key: str):
+        '''the stored entry, or None if there is none'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning('Could not read the cache entry %s, ignoring...', key)
+            return None
+        # mark it as recently used
+        os.utime(path)
+        return entry
+
+    def put(self, key: str, entry) -> bool:
+        '''store the entry, returns False if it cannot be stored'''
+        try:
+            data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return False
+        if len(data) > self.max_size:
+            return False
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            # like a full disk or a read only directory
+            logger.warning('Could not store the cache entry %s (%s), skipping...', key, exc)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        self.size += len(data) - old_size
+        if self.size > self.max_size:
+            self.evict()
+        return True
+
+    def evict(self):
+        '''remove the least recently used entries until it fits'''
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        self.size = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if self.size <= self.max_size * EVICT_TO:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -7,7 +7,10 @@ module and returns the procedure of the calculations
 
 import ast
 import logging
-from .parsing import to_math, MathVisitor, UNIT_PF, build_eqn, _split, DEFAULT_MAT_SIZE
+from itertools import zip_longest
+from threading import Lock
+from .profiling import stage
+from .parsing import to_math, MathVisitor, StepsVisitor, UNIT_PF, build_eqn, find_name_targets, _prep4lx, _split, DEFAULT_MAT_SIZE
 
 log = logging.getLogger(__name__)
 
@@ -19,7 +22,6 @@ DERIVED = {
     'W': 'kg*m**2/s**3',
     'Hz': '_/s',
 }
-DERIVED = {u: ast.parse(DERIVED[u]).body[0].value for u in DERIVED}
 
 FALLBACK_OPTIONS = {
     'steps': [],
@@ -34,9 +36,50 @@ FALLBACK_OPTIONS = {
     'newlines': 0,
 }
 
+# the name an evaluated value is bound to while assigning it to the targets
+VALUE_NAME = '__DOCAL_VALUE__'
+# the name of the registry of the units in use in the working dict
+UNITS_NAME = '__DOCAL_UNITS__'
 
-def _calculate(expr: ast.AST, options: dict, working_dict: dict, mul=' ', div='/', syntax=None):
-    '''carryout the necesary calculations and assignments'''
+
+def _calculate(expr: ast.AST, options: dict, working_dict: dict, mul=' ', div='/', syntaxes=()):
+    '''
+    carryout the necesary calculations and assignments, with the steps
+    rendered with each of the syntaxes
+    '''
+
+    value_ast = expr if options['result'] is None else options['result']
+    with stage('eval'):
+        value = eval(compile(ast.Expression(value_ast), '<calculation>', 'eval'),
+                     working_dict)
+    with stage('render'):
+        results = [_render_steps(expr, value, value_ast, options, working_dict, mul, div, syntax)
+                   for syntax in syntaxes]
+    # detect if the user is trying to give a different unit and give warning
+    with stage('units'):
+        if options['unit']:
+            # in their vector forms
+            given = UnitHandler(True, working_dict).visit(options['unit'])
+            calculated = UnitHandler(False, working_dict).visit(expr)
+            # if it is detected, warn the user but accept it anyway, unless the
+            # calculated one has no unit
+            if given != calculated and calculated != DIMENSIONLESS:
+                log.warning(
+                    'The input unit is not equivalent to the calculated one.')
+        else:
+            options['unit'] = unitize(expr, working_dict)
+    with stage('render'):
+        for result, syntax in zip(results, syntaxes):
+            result[-1] += to_math(options['unit'], div='/', syntax=syntax, ital=False)
+            if options['note'] is not None:
+                result[-1] += syntax.txt(syntax.halfsp) + syntax.txt_math(options['note'])
+
+    return results, value
+
+
+def _render_steps(expr: ast.AST, value, value_ast: ast.AST, options: dict, working_dict: dict,
+                  mul: str, div: str, syntax) -> list:
+    '''the steps of the calculation of the value of expr, rendered with the syntax'''
 
     lx_args = lambda ex, subs=None: MathVisitor(mul=mul,
                                                 div=div,
@@ -45,51 +88,69 @@ def _calculate(expr: ast.AST, options: dict, working_dict: dict, mul=' ', div='/
                                                 decimal=options['decimal'],
                                                 working_dict=working_dict,
                                                 syntax=syntax
-                                                ).visit(ex)
-
-    value_ast = expr if options['result'] is None else options['result']
-    value = eval(compile(ast.Expression(value_ast), '<calculation>', 'eval'),
-                 working_dict)
-    result = [lx_args(expr)]
-    result_rest = [
-        lx_args(expr, True),
-        lx_args(value if not isinstance(value_ast, ast.Lambda) else value_ast)]
+                                                ).render(ex)
+    # the first two steps in a single traversal
+    steps_visitor = lambda: StepsVisitor(mul=mul,
+                                         div=div,
+                                         mat_size=options['mat_size'],
+                                         decimal=options['decimal'],
+                                         working_dict=working_dict,
+                                         syntax=syntax)
+
+    if isinstance(value_ast, ast.Lambda):
+        value_prep = value_ast
+    elif isinstance(value, ast.AST):
+        value_prep = ast.Constant(str(value))
+    else:
+        value_prep = _prep4lx(value, syntax, options['mat_size']).value
 
     if options['steps']:
-        result += result_rest
-        result = [result[s] for s in options['steps'] if 0 <= s <= 2]
+        # only render the requested steps
+        steps = [s for s in options['steps'] if 0 <= s <= 2]
+        rendered = {}
+        if 0 in steps and 1 in steps:
+            rendered[0], rendered[1] = steps_visitor().render(expr)
+        elif 0 in steps:
+            rendered[0] = lx_args(expr)
+        elif 1 in steps:
+            rendered[1] = lx_args(expr, True)
+        if 2 in steps:
+            rendered[2] = lx_args(value_prep)
+        return [rendered[s] for s in steps]
     # remove repeated steps (retaining order)
-    elif isinstance(expr, ast.Constant) or isinstance(value_ast, ast.Lambda):
-        result = [result_rest[1]]
-    elif isinstance(expr, ast.Name):
-        result = [result[0], result_rest[1]]
-    else:
-        last_str = str(result[0])
-        for step in result_rest:
-            step_str = str(step)
-            if step_str != last_str:
-                last_str = step_str
-                result.append(step)
-    # detect if the user is trying to give a different unit and give warning
-    if options['unit']:
-        # in their dict forms
-        compared = [UnitHandler(True, working_dict).visit(options['unit']),
-                    UnitHandler(False, working_dict).visit(expr)]
-        # when the calculated already has a unit
-        compared = [compared, [compared[1], [{}, {}]]]
-        # if it is detected, warn the user but accept it anyway
-        if not are_equivalent(*compared[1]) and not are_equivalent(*compared[0]):
-            log.warning(
-                'The input unit is not equivalent to the calculated one.')
-    else:
-        options['unit'] = unitize(expr, working_dict)
-    
-    result[-1] += to_math(options['unit'], div='/', syntax=syntax, ital=False)
-    if options['note'] is not None:
-        result[-1] += syntax.txt(syntax.halfsp) + syntax.txt_math(options['note'])
-
+    if isinstance(expr, ast.Constant) or isinstance(value_ast, ast.Lambda):
+        return [lx_args(value_prep)]
+    if isinstance(expr, ast.Name):
+        return [lx_args(expr), lx_args(value_prep)]
+    visitor = steps_visitor()
+    sym, subs = visitor.render(expr)
+    result = [sym]
+    # the same as the expression if nothing was substituted. the rendered
+    # steps are compared, not their trees or ASTs: the value is rendered from
+    # another AST than the expression and can still come out the same, like
+    # - 2 for both the substituted -a and the value -2
+    for step in [subs, lx_args(value_prep)] if visitor.substituted else [lx_args(value_prep)]:
+        if step != result[-1]:
+            result.append(step)
     return result
 
+
+def assign(node: ast.Assign, value, working_dict: dict):
+    '''
+    bind an already evaluated value to the targets of the assignment, with
+    the same semantics as executing it (unpacking, multiple targets)
+    '''
+    if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+        working_dict[node.targets[0].id] = value
+        return
+    binding = ast.copy_location(ast.Assign(node.targets, ast.Name(VALUE_NAME, ast.Load())), node)
+    co = compile(ast.fix_missing_locations(ast.Module([binding], [])), '<calculation>', 'exec')
+    working_dict[VALUE_NAME] = value
+    try:
+        exec(co, working_dict)
+    finally:
+        del working_dict[VALUE_NAME]
+
 def _process_options(additionals, defaults=FALLBACK_OPTIONS, syntax=None):
 
     options = {}
@@ -143,7 +204,16 @@ def cal(input_str: ast.AST, working_dict={}, mul=' ', div='frac', syntax=None, o
     and return all the procedures
 
     '''
-    result = _calculate(input_str.value, options, working_dict, mul, div, syntax=syntax)
+    return cal_all(input_str, working_dict, [syntax], mul, div, options)[0]
+
+
+def cal_all(input_str: ast.AST, working_dict: dict, syntaxes: list, mul=' ', div='frac',
+            options={}) -> list[tuple]:
+    '''
+    cal, evaluating once and returning the procedures rendered with each of
+    the syntaxes
+    '''
+    results, value = _calculate(input_str.value, options, working_dict, mul, div, syntaxes=syntaxes)
     if options['mode'] == 'inline':
         displ = False
     elif options['mode'] == 'display':
@@ -156,37 +226,104 @@ def cal(input_str: ast.AST, working_dict={}, mul=' ', div='frac', syntax=None, o
 
     disp = 'disp' if displ else 'inline'
 
+    procedures = []
     if isinstance(input_str, ast.Assign):
-        var_names = [v.id for v in input_str.targets]
-        var_lx = syntax.txt('=').join([to_math(var_name, syntax=syntax) for var_name in input_str.targets])
-
-        procedure = [[var_lx, result[0]]]
-        for step in result[1:]:
-            procedure.append([syntax.txt(''), step])
-
-        if options['result'] is not None:
-            input_str.value = options['result'] # override the value stored
-        # carry out normal op in main script
-        co = compile(ast.Module([input_str], []), '<calculation>', 'exec')
-        exec(co, working_dict)
+        var_names = [name for target in input_str.targets for name in find_name_targets(target)]
+        for result, syntax in zip(results, syntaxes):
+            var_lx = syntax.txt('=').join([to_math(var_name, syntax=syntax) for var_name in input_str.targets])
+
+            procedure = [[var_lx, result[0]]]
+            for step in result[1:]:
+                procedure.append([syntax.txt(''), step])
+            procedures.append(procedure)
+
+        # carry out normal op in main script, with the value (of the
+        # overriding result if given) that is already evaluated
+        with stage('eval'):
+            assign(input_str, value, working_dict)
         # for later unit retrieval
-        for var in var_names:
-            working_dict[var + UNIT_PF] = options['unit']
+        with stage('units'):
+            for var in var_names:
+                set_unit(working_dict, var, options['unit'])
 
     else:
-        if len(result) > 1:
-            procedure = [[result[0], result[1]]]
-            if result[2:]:
-                procedure.append([syntax.txt(''), result[2]])
-        else:
-            procedure = [result]
+        for result, syntax in zip(results, syntaxes):
+            if len(result) > 1:
+                procedure = [[result[0], result[1]]]
+                if result[2:]:
+                    procedure.append([syntax.txt(''), result[2]])
+            else:
+                procedure = [result]
+            procedures.append(procedure)
 
     if options['hidden']:
-        return ('text', '')
+        return [('text', '')] * len(syntaxes)
+
+    with stage('render'):
+        return [(disp, build_eqn(procedure, displ, options['vert'], syntax))
+                for procedure, syntax in zip(procedures, syntaxes)]
+
+
+# the names of the base units, in the order of their positions in the unit
+# vectors. It only grows, as new names are found in the units used.
+BASES = []
+_BASE_INDICES = {}
+_bases_lock = Lock()
+
+
+def _base_index(name: str) -> int:
+    try:
+        return _BASE_INDICES[name]
+    except KeyError:
+        with _bases_lock:
+            if name not in _BASE_INDICES:
+                _BASE_INDICES[name] = len(BASES)
+                BASES.append(name)
+        return _BASE_INDICES[name]
+
+
+class Unit(tuple):
+    '''
+    a unit as the powers of the base units, at their positions in BASES. The
+    trailing zero powers are dropped so that equivalent units are equal.
+    '''
+
+    __slots__ = ()
+
+    def __new__(cls, powers=()):
+        powers = list(powers)
+        while powers and not powers[-1]:
+            powers.pop()
+        return super().__new__(cls, powers)
+
+    @classmethod
+    def base(cls, name: str):
+        '''the unit of a single base unit name'''
+        if name == '_':
+            return DIMENSIONLESS
+        return cls([0] * _base_index(name) + [1])
 
-    output = build_eqn(procedure, displ, options['vert'], syntax)
+    def __mul__(self, other):
+        return Unit(a + b for a, b in zip_longest(self, other, fillvalue=0))
 
-    return (disp, output)
+    def __truediv__(self, other):
+        return Unit(a - b for a, b in zip_longest(self, other, fillvalue=0))
+
+    def __pow__(self, power):
+        return Unit(a * power for a in self)
+
+    def split(self) -> tuple[dict, dict]:
+        '''the names and powers of the numerator and the denominator'''
+        upper, lower = {}, {}
+        for name, power in sorted(zip(BASES, self)):
+            if power > 0:
+                upper[name] = power
+            elif power < 0:
+                lower[name] = -power
+        return upper, lower
+
+
+DIMENSIONLESS = Unit()
 
 
 class UnitHandler(ast.NodeVisitor):
@@ -202,25 +339,20 @@ class UnitHandler(ast.NodeVisitor):
         if self.norm:
             unit = n
         else:
-            if n.id + UNIT_PF in self.dict:
-                unit = self.dict[n.id + UNIT_PF]
-            else:
-                unit = ast.parse('_').body[0].value
+            unit = self.dict.get(n.id + UNIT_PF)
+            if unit is None:
+                return DIMENSIONLESS
         if isinstance(unit, ast.Name):
             if unit.id in DERIVED:
-                unit = DERIVED[unit.id]
-            elif hasattr(n, 'upper') and not n.upper:
-                return [{}, {unit.id: 1}]
-            else:
-                return [{unit.id: 1}, {}]
-        unit.upper = n.upper if hasattr(n, 'upper') else True
+                return DERIVED[unit.id]
+            return Unit.base(unit.id)
         # store and temporarily disregard the state self.norm
         prev_norm = self.norm
         self.norm = True
-        ls = self.visit(unit)
+        unit = self.visit(unit)
         # revert to the previous state
         self.norm = prev_norm
-        return ls
+        return unit
 
     def visit_Call(self, n):
         if isinstance(n.func, ast.Attribute):
@@ -228,86 +360,24 @@ class UnitHandler(ast.NodeVisitor):
         elif isinstance(n.func, ast.Name):
             func = n.func.id
         else:
-            func = self.visit(n.func)
+            func = None
         if func == 'sqrt':
-            return self.visit(ast.BinOp(left=n.args[0], op=ast.Pow(), right=ast.Constant(value=1/2)))
-        return [{}, {}]
+            return self.visit(n.args[0]) ** (1/2)
+        return DIMENSIONLESS
 
     def visit_BinOp(self, n):
-        if hasattr(n, 'upper') and not n.upper:
-            upper = False
-        else:
-            upper = True
-        n.left.upper = upper
         left = self.visit(n.left)
         if isinstance(n.op, ast.Pow):
-            if isinstance(n.right, ast.BinOp):
-                if isinstance(n.right.left, ast.Constant) and isinstance(n.right, ast.Constant):
-                    if isinstance(n.right.op, ast.Add):
-                        p = n.right.left.value + n.right.value
-                    elif isinstance(n.right.op, ast.Sub):
-                        p = n.right.left.value - n.right.value
-                    elif isinstance(n.right.op, ast.Mult):
-                        p = n.right.left.value * n.right.value
-                    elif isinstance(n.right.op, ast.Div):
-                        p = n.right.left.value / n.right.value
-                    elif isinstance(n.right.op, ast.Pow):
-                        p = n.right.left.value ** n.right.value
-                else:
-                    # XXX
-                    p = 1
-            elif isinstance(n.right, ast.UnaryOp):
-                if isinstance(n.right.operand, ast.Constant):
-                    if isinstance(n.right.op, ast.USub):
-                        p = - n.right.operand.value
-                    elif isinstance(n.right.op, ast.UAdd):
-                        p = n.right.operand.value
-            elif isinstance(n.right, ast.Constant):
-                p = n.right.value
-            else:
-                # XXX
-                p = 1
-            for u in left[0]:
-                left[0][u] *= p
-            for u in left[1]:
-                left[1][u] *= p
-            return left
+            return left ** _power(n.right)
         elif isinstance(n.op, ast.Mult):
-            n.right.upper = upper
-            right = self.visit(n.right)
-            for u in right[0]:
-                if u in left[0]:
-                    left[0][u] += right[0][u]
-                else:
-                    left[0][u] = right[0][u]
-            for u in right[1]:
-                if u in left[1]:
-                    left[1][u] += right[1][u]
-                else:
-                    left[1][u] = right[1][u]
-            return left
+            return left * self.visit(n.right)
         elif isinstance(n.op, ast.Div):
-            n.right.upper = not upper
-            right = self.visit(n.right)
-            for u in right[0]:
-                if u in left[0]:
-                    left[0][u] += right[0][u]
-                else:
-                    left[0][u] = right[0][u]
-            for u in right[1]:
-                if u in left[1]:
-                    left[1][u] += right[1][u]
-                else:
-                    left[1][u] = right[1][u]
-            return left
+            return left / self.visit(n.right)
         elif isinstance(n.op, ast.Add) or isinstance(n.op, ast.Sub):
-            n.right.upper = upper
-            left = reduce(left)
-            right = reduce(self.visit(n.right))
-            if are_equivalent(left, right):
+            if left == self.visit(n.right):
                 return left
             log.warning('The units of the two sides are not equivalent.')
-            return [{}, {}]
+        return DIMENSIONLESS
 
     def visit_UnaryOp(self, n):
         return self.visit(n.operand)
@@ -316,7 +386,115 @@ class UnitHandler(ast.NodeVisitor):
         return self.visit(n.value)
 
     def generic_visit(self, n):
-        return [{}, {}]
+        return DIMENSIONLESS
+
+
+def _power(n: ast.AST):
+    '''the value of a constant power, 1 if it is not a constant'''
+    if isinstance(n, ast.Constant):
+        return n.value
+    if isinstance(n, ast.UnaryOp) and isinstance(n.operand, ast.Constant):
+        if isinstance(n.op, ast.USub):
+            return - n.operand.value
+        elif isinstance(n.op, ast.UAdd):
+            return n.operand.value
+    elif isinstance(n, ast.BinOp) and isinstance(n.left, ast.Constant) \
+            and isinstance(n.right, ast.Constant):
+        if isinstance(n.op, ast.Add):
+            return n.left.value + n.right.value
+        elif isinstance(n.op, ast.Sub):
+            return n.left.value - n.right.value
+        elif isinstance(n.op, ast.Mult):
+            return n.left.value * n.right.value
+        elif isinstance(n.op, ast.Div):
+            return n.left.value / n.right.value
+        elif isinstance(n.op, ast.Pow):
+            return n.left.value ** n.right.value
+    # XXX
+    return 1
+
+
+# the derived units in their vector forms
+DERIVED = {u: UnitHandler(True).visit(ast.parse(DERIVED[u]).body[0].value) for u in DERIVED}
+
+
+class UnitRegistry:
+    '''
+    the units of the variables that contain one of the DERIVED units, by
+    their vectors, which unitize can choose from. It is kept up to date as
+    the units of the variables are set so that choosing one is a lookup.
+    '''
+
+    def __init__(self):
+        # the vector and the source of the unit of each registered variable
+        self.names: dict[str, tuple[Unit, str]] = {}
+        # for each vector, the units and how many variables have them, the
+        # most recently used last
+        self.units: dict[Unit, dict[str, tuple[ast.AST, int]]] = {}
+
+    @classmethod
+    def of(cls, working_dict: dict):
+        '''a registry of the units already in the working dict'''
+        registry = cls()
+        for name, unit in working_dict.items():
+            if name.endswith(UNIT_PF):
+                registry.set(name[:-len(UNIT_PF)], unit)
+        return registry
+
+    def set(self, name: str, unit: ast.AST | None):
+        '''register the unit of the variable, replacing its previous one'''
+        self.unset(name)
+        if unit is None or not any(isinstance(n, ast.Name) and n.id in DERIVED
+                                   for n in ast.walk(unit)):
+            return
+        vector = UnitHandler(True).visit(unit)
+        source = ast.dump(unit)
+        units = self.units.setdefault(vector, {})
+        # move it to the end as the most recently used
+        _, count = units.pop(source, (None, 0))
+        units[source] = (unit, count + 1)
+        self.names[name] = (vector, source)
+
+    def unset(self, name: str):
+        '''remove the unit of the variable'''
+        if name not in self.names:
+            return
+        vector, source = self.names.pop(name)
+        units = self.units[vector]
+        unit, count = units[source]
+        if count > 1:
+            units[source] = (unit, count - 1)
+        else:
+            del units[source]
+            if not units:
+                del self.units[vector]
+
+    def find(self, vector: Unit) -> ast.AST | None:
+        '''the most recently used unit with the vector, if there is one'''
+        units = self.units.get(vector)
+        if units:
+            return next(reversed(units.values()))[0]
+        return None
+
+
+def unit_registry(working_dict: dict) -> UnitRegistry:
+    '''the registry of the units in the working dict, made if not there'''
+    registry = working_dict.get(UNITS_NAME)
+    if registry is None:
+        registry = working_dict[UNITS_NAME] = UnitRegistry.of(working_dict)
+    return registry
+
+
+def set_unit(working_dict: dict, name: str, unit: ast.AST | None):
+    '''set the unit of the variable, for later retrieval'''
+    working_dict[name + UNIT_PF] = unit
+    unit_registry(working_dict).set(name, unit)
+
+
+def del_unit(working_dict: dict, name: str):
+    '''remove the unit of the variable, if it has one'''
+    working_dict.pop(name + UNIT_PF, None)
+    unit_registry(working_dict).unset(name)
 
 
 def unitize(s: ast.AST, working_dict={}) -> str:
@@ -326,22 +504,14 @@ def unitize(s: ast.AST, working_dict={}) -> str:
     converted into latex using to_math
     '''
 
-    ls = reduce(UnitHandler(False, working_dict).visit(s))
-
-    # the var names that are of units in the main dict that are not _
-    in_use = {working_dict[u] for u in working_dict
-              if u.endswith(UNIT_PF) and working_dict[u] != ast.Name(id='_')}
-    # var names in in_use whose values contain one of the DERIVED units
-    in_use = [u for u in in_use
-              if any([n.id in DERIVED
-                      for n in [n for n in ast.walk(u) if isinstance(n, ast.Name)]])]
-    # search in reverse order to choose the most recently used unit
-    in_use.reverse()
-    # if this unit is equivalent to one of them, return that
-    for unit in in_use:
-        if are_equivalent(UnitHandler(True, working_dict).visit(unit), ls):
-            return unit
+    unit_vec = UnitHandler(False, working_dict).visit(s)
 
+    # if this unit is equivalent to one in use, return the most recent one
+    unit = unit_registry(working_dict).find(unit_vec)
+    if unit is not None:
+        return unit
+
+    ls = unit_vec.split()
     upper = "*".join([u if ls[0][u] == 1 else f'{u}**{ls[0][u]}'
                       for u in ls[0]])
     lower = "*".join([u if ls[1][u] == 1 else f'{u}**{ls[1][u]}'
@@ -350,50 +520,3 @@ def unitize(s: ast.AST, working_dict={}) -> str:
     s_upper = f'({upper})' if ls[0] else "_"
     s_lower = f'/({lower})' if ls[1] else ""
     return ast.parse(s_upper + s_lower).body[0].value
-
-
-def are_equivalent(unit1: dict, unit2: dict) -> bool:
-    '''
-    return True if the units are equivalent, False otherwise
-    '''
-
-    unit1, unit2 = reduce(unit1), reduce(unit2)
-    conditions = [
-        # the numerators have the same elements
-        set(unit1[0]) == set(unit2[0]) and \
-        # each item's value (power) is the same in both
-        all([unit1[0][e] == unit2[0][e] for e in unit1[0]]),
-        # the denominators have the same elements
-        set(unit1[1]) == set(unit2[1]) and \
-        # and each item's value (power) is the same in both
-        all([unit1[1][e] == unit2[1][e] for e in unit1[1]]),
-    ]
-
-    return all(conditions)
-
-
-def reduce(ls: list) -> list:
-    '''
-    cancel out units that appear in both the numerator and denominator, those
-    that have no name (_) and those with power of 0
-    '''
-    upper = {**ls[0]}
-    lower = {**ls[1]}
-    for u in ls[0]:
-        if u in ls[1]:
-            if upper[u] > lower[u]:
-                upper[u] -= lower[u]
-                del lower[u]
-            elif upper[u] < lower[u]:
-                lower[u] -= upper[u]
-                del upper[u]
-            else:
-                del upper[u]
-                del lower[u]
-    for u in {**upper}:
-        if upper[u] == 0 or u == '_':
-            del upper[u]
-    for u in {**lower}:
-        if lower[u] == 0 or u == '_':
-            del lower[u]
-    return [upper, lower]
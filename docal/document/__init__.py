@@ -1,3 +1,4 @@
+from os import PathLike
 from dataclasses import dataclass
 
 @dataclass
@@ -5,3 +6,8 @@ class Tag:
     name: str
     block: bool
     table: bool
+
+
+def is_path(file) -> bool:
+    '''whether the file is given by its path, not as bytes or a file object'''
+    return isinstance(file, (str, PathLike))
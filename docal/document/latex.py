@@ -1,8 +1,12 @@
 from os import path
 import re
 import logging
+from collections.abc import Mapping
+from tempfile import TemporaryFile
+from contextlib import contextmanager
+from io import BytesIO, TextIOBase, TextIOWrapper
 from ..processing import PATTERN
-from . import Tag
+from . import Tag, is_path
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +16,12 @@ DEFAULT_FILE = 'Untitled.tex'
 # change the actual content of the document, and works inside lines)
 SURROUNDING = ['{} {{ {}', '{} }} {}']
 
+# the size of the contents of the tags kept in memory while writing, beyond
+# which they are moved to a temporary file
+SPOOL_SIZE = 1 << 22
+# the number of pieces of the output joined to be written at once
+WRITE_BATCH = 1024
+
 GREEK_LETTERS = ['alpha',
                  'nu',
                  'beta',
@@ -94,6 +104,11 @@ class syntax:
     math_accents = MATH_ACCENTS
     primes = PRIMES
 
+    # the methods that only place their arguments in the text, made into
+    # templates for the large math
+    template_forms = frozenset({'sub', 'sup', 'acc', 'rad', 'summation', 'func_name', 'frac',
+                                'math_disp', 'math_inln', 'accent', 'delmtd', 'matrix', 'eqarray'})
+
     def txt(self, text):
         return text
 
@@ -156,8 +171,73 @@ class syntax:
         return srnds[0] + inner + srnds[1]
 
 
+class spool:
+    '''
+    the contents of the tags, each joined by new lines, kept in memory until
+    they become large and then moved to a temporary file
+    '''
+
+    def __init__(self, max_size=SPOOL_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.file = None
+        # the places of the blocks of the contents of each tag in the file
+        self.blocks: dict[str, list[tuple[int, int]]] = {}
+        # the contents not moved to the file yet
+        self.pending: dict[str, list[str]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.file is not None:
+            self.file.close()
+
+    def __iter__(self):
+        return iter(self.pending)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, tag: str, content: str):
+        pending = self.pending.get(tag)
+        if pending is None:
+            pending = self.pending[tag] = []
+            self.blocks[tag] = []
+        pending.append(content)
+        self.size += len(content)
+        if self.size > self.max_size:
+            self._flush()
+
+    def _flush(self):
+        if self.file is None:
+            self.file = TemporaryFile()
+        self.file.seek(0, 2)
+        for tag, pending in self.pending.items():
+            if not pending:
+                continue
+            data = '\n'.join(pending).encode('utf-8')
+            self.blocks[tag].append((self.file.tell(), len(data)))
+            self.file.write(data)
+            pending.clear()
+        self.size = 0
+
+    def pieces(self, tag: str) -> list[str]:
+        '''the contents of the tag, in pieces of at most about the max size'''
+        pieces = []
+        for offset, size in self.blocks[tag]:
+            self.file.seek(offset)
+            pieces += ['\n', self.file.read(size).decode('utf-8')]
+        if self.pending[tag]:
+            pieces += ['\n', '\n'.join(self.pending[tag])]
+        return pieces[1:]
+
+
 class document:
-    '''handles the latex files'''
+    '''
+    handles the latex files, given as paths, bytes or file objects, with the
+    output a BytesIO if not given for an input that is not a path
+    '''
 
     # warning for tag place protection in document:
     warning = ('BELOW IS AN AUTO GENERATED LIST OF TAGS. '
@@ -169,8 +249,12 @@ class document:
         self.pattern = PATTERN
         if infile:
             self.infile = infile
-            with open(self.infile, encoding='utf-8') as file:
-                self.file_contents = file.read()
+            if is_path(infile):
+                with open(infile, encoding='utf-8') as file:
+                    self.file_contents = file.read()
+            else:
+                contents = infile if isinstance(infile, (bytes, bytearray, memoryview)) else infile.read()
+                self.file_contents = contents if isinstance(contents, str) else str(contents, 'utf-8')
             # the collection of tags at the bottom of the file for reversing
             self.tagline = re.search(fr'\n% *{re.escape(self.warning)}'
                                      r'*[\[[a-zA-Z0-9_ ]+\]\]',
@@ -179,17 +263,20 @@ class document:
             if self.tagline:
                 start = self.tagline.group(0).find('[[') + 2
                 end = self.tagline.group(0).rfind(']]')
-                self.tags = [Tag(name=tag, table=False) for tag in self.tagline.group(0)[start:end].split()]
+                self.tags = [Tag(name=tag, block=True, table=False) for tag in self.tagline.group(0)[start:end].split()]
                 self._revert_tags()
-            self.tags = [Tag(name=tag.group(2), table=False)
+            self.tags = [Tag(name=tag.group(2), block=True, table=False)
                          for tag in self.pattern.finditer(self.file_contents)]
         else:
             self.file_contents = '\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n%s\n\\end{document}' 
             self.infile = self.tagline = self.tags = None
         if outfile is None:
-            self.outfile = self.infile if self.infile else DEFAULT_FILE
+            if not self.infile:
+                self.outfile = DEFAULT_FILE
+            else:
+                self.outfile = self.infile if is_path(self.infile) else BytesIO()
         else:
-            self.outfile = path.abspath(outfile)
+            self.outfile = path.abspath(outfile) if is_path(outfile) else outfile
         self.calc_tags = []
 
     def _revert_tags(self):
@@ -207,55 +294,86 @@ class document:
         self.file_contents = file_str
         return file_str
 
-    def _subs_in_place(self, values: dict):
-        file_str = self.file_contents + f'\n\n% {self.warning} [['
-        file_str = self.pattern.sub(lambda x: self._repl(x, True, values),
-                               file_str)
-        for tag in self.calc_tags:
-            file_str += tag.name + ' '
-        file_str = file_str.rstrip('\n') + ']]'
-        return file_str
-
-    def _subs_separate(self, values: dict):
-        return self.pattern.sub(lambda x: self._repl(x, False, values),
-                           self.file_contents)
-
-    def _repl(self, match_object, surround: bool, values: dict):
-        start, tag, end = [m if m else '' for m in match_object.groups()]
-        if tag in values:
-            result = '\n'.join([val[1] for val in values[tag]])
+    def _subs_tags(self, file, spools: spool, surround: bool):
+        '''write the file contents with the tags replaced by their contents'''
+        contents = self.file_contents
+        pieces = []
+        last = 0
+        for match in self.pattern.finditer(contents):
+            start, tag, end = match.groups()
+            pieces.append(contents[last:match.start()])
+            last = match.end()
+            if tag not in spools.pending:
+                logger.error(f"There is nothing to send to #{tag}.")
+                pieces.append(start + '#' + tag + end)
+                continue
             if surround:
-                return (start
-                        + SURROUNDING[0]
-                        + (start if start == '\n' else '')
-                        + result
-                        + (end if end == '\n' else '')
-                        + SURROUNDING[1]
-                        + end)
-
-            return start + result + end
-        logger.error(f"There is nothing to send to #{tag}.")
-        return start + '#' + tag + end
+                pieces.append(start + SURROUNDING[0] + (start if start == '\n' else ''))
+                pieces += spools.pieces(tag)
+                pieces.append((end if end == '\n' else '') + SURROUNDING[1] + end)
+            else:
+                pieces.append(start)
+                pieces += spools.pieces(tag)
+                pieces.append(end)
+            if len(pieces) > WRITE_BATCH:
+                file.write(''.join(pieces))
+                pieces.clear()
+        pieces.append(contents[last:])
+        file.write(''.join(pieces))
+
+    @contextmanager
+    def _open_output(self):
+        '''the output as a text file, left open after writing if a file object'''
+        if is_path(self.outfile):
+            with open(self.outfile, 'w', encoding='utf-8') as file:
+                yield file
+            return
+        if isinstance(self.outfile, TextIOBase):
+            file = self.outfile
+        else:
+            file = TextIOWrapper(self.outfile, encoding='utf-8', newline='')
+        try:
+            yield file
+        finally:
+            file.flush()
+            if file is not self.outfile:
+                # not to close the binary file with it
+                file.detach()
 
     def write(self, values={}):
-        tag_names = set(tag.name for tag in self.tags)
-        if len(values):
-            if self.infile:
-                for tag in values:
-                    if tag in tag_names:
-                        self.calc_tags.append(tag)
-                    else:
-                        logger.error(f'#{tag} not found in the document.')
-                if path.abspath(self.outfile) == path.abspath(self.infile):
-                    self.file_contents = self._subs_in_place(values)
+        '''
+        write the document with the values, a dict of the tags and their
+        parts or (tag, part) pairs as they are rendered, whose contents are
+        moved out of memory when they become large
+        '''
+        if isinstance(values, Mapping):
+            values = ((tag, part) for tag, parts in values.items() for part in parts)
+        with spool() as spools:
+            for tag, part in values:
+                spools.add(tag, part[1])
+            logger.info('[writing file] %s', self.outfile)
+            with self._open_output() as file:
+                if not spools:
+                    file.write(self.file_contents)
+                elif self.infile:
+                    tag_names = set(tag.name for tag in self.tags)
+                    for tag in spools:
+                        if tag in tag_names:
+                            self.calc_tags.append(tag)
+                        else:
+                            logger.error(f'#{tag} not found in the document.')
+                    in_place = is_path(self.outfile) and is_path(self.infile) \
+                        and path.abspath(self.outfile) == path.abspath(self.infile)
+                    self._subs_tags(file, spools, in_place)
+                    if in_place:
+                        file.write(f'\n\n% {self.warning} [[')
+                        file.write(''.join(tag + ' ' for tag in self.calc_tags) + ']]')
                 else:
-                    self.file_contents = self._subs_separate(values)
-            else:
-                self.file_contents = self.file_contents % '\n'.join([
-                    '\n'.join([v[1] for v in val]) for val in values.values()
-                ])
-
-        logger.info('[writing file] %s', self.outfile)
-        with open(self.outfile, 'w', encoding='utf-8') as file:
-            file.write(self.file_contents)
+                    head, tail = self.file_contents.split('%s')
+                    file.write(head)
+                    for i, tag in enumerate(spools):
+                        if i:
+                            file.write('\n')
+                        file.writelines(spools.pieces(tag))
+                    file.write(tail)
 
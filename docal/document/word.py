@@ -1,29 +1,42 @@
 # for word file handling
 import xml.etree.ElementTree as ET
 from xml.sax.saxutils import escape
-from xml.dom.minidom import parseString
-from zipfile import ZipFile, ZIP_DEFLATED
+from xml.parsers import expat
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-# for file operations
-from shutil import move, rmtree
 # for access to resource template
 from importlib.resources import files
-# for temp directory
-import tempfile
+from functools import cache
+from io import BytesIO
+from copy import copy, deepcopy
+from collections.abc import Mapping
+# for the file being written
+from secrets import token_hex
 # for path manips
-from os import path
+from os import path, replace, remove, cpu_count
 # for regex
 import re
 # log info
 import logging
 # tag pattern
 from ..processing import PATTERN
-from . import Tag
+from . import Tag, is_path
+from .zipio import can_copy_member, copy_member, copy_bytes, copy_decompressed, can_compress_in_parallel, ParallelCompressor, CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_FILE = 'Untitled.docx'
 TABLE_FLAG_INDEX = -1
+# the number of parts converted to paragraphs at a time while writing
+BATCH_SIZE = 256
+# the size of the document part above which it is streamed (see document)
+STREAM_SIZE = 32 << 20
+# the size of the document part above which it is compressed in pieces in a
+# thread pool
+PARALLEL_SIZE = 8 << 20
+# a namespace declaration as serialized by ElementTree
+XMLNS_PATTERN = re.compile(r' xmlns:\w+="[^"]*"')
 
 GREEK_LETTERS = {
     'alpha':      'α',
@@ -84,13 +97,24 @@ PRIMES = {'prime': "'", '2prime': "''", '3prime': "'''"}
 
 TAG_ALT_FORM = '#{%s}'
 
+@dataclass
+class TableWord:
+    '''the rows of a table and the cells of each, kept as they are added'''
+    tbl: ET.Element
+    rows: list[ET.Element]
+    cells: list[list[ET.Element]]
+
 @dataclass
 class TagWord(Tag):
     alt: str
     address: list[ET.Element]
     index: int
-    tbl: ET.Element | None = None
-    tbl_row: ET.Element | None = None
+    # the index of the run of the tag in the paragraph
+    run_index: int = 0
+    # for table tags, the table and the row and column of the cell
+    tbl: TableWord | None = None
+    row: int = 0
+    col: int = 0
 
 class syntax:
 
@@ -121,6 +145,11 @@ class syntax:
     math_accents = MATH_ACCENTS
     primes = PRIMES
 
+    # the methods that only place their arguments in the text, made into
+    # templates for the large math
+    template_forms = frozenset({'sub', 'sup', 'rad', 'summation', 'func_name', 'frac', 'math_disp',
+                                'math_inln', 'delmtd', 'matrix', 'eqarray'})
+
     def txt(self, text):
         return f'<m:r><m:t xml:space="preserve">{text}</m:t></m:r>'
 
@@ -184,58 +213,281 @@ class syntax:
         align_chr = self.txt('&amp;=')
         return form.format(''.join([line_form.format(align_chr.join(eq)) for eq in eqns]))
 
+@cache
+def default_template() -> bytes:
+    '''the contents of the template used when there is no input file'''
+    return files(__name__).joinpath('word.docx').read_bytes()
+
+
+def _quote(value: str) -> str:
+    '''the value escaped for a double quoted attribute'''
+    return '"' + escape(value, {'"': '&quot;'}) + '"'
+
+
 class document:
+    '''
+    a word document with tags. The input can be the path of the file, its
+    bytes or a binary file object, and the output a path or a binary file
+    object, a BytesIO if not given for an input that is not a path. In stream
+    mode, which is the default for
+    document parts larger than STREAM_SIZE, only the children of the body
+    that have tags are kept in memory, and the rest of the part is copied to
+    the output as it is.
+
+    compression and compresslevel are those of the output package, like in
+    ZipFile. The members of the input are copied as they are compressed,
+    unless they have to be decompressed for ZIP_STORED.
+    '''
 
     # the xml declaration
     declaration = '<?xml version="1.0" encoding="utf-8" standalone="yes"?>\n'
 
-    def __init__(self, infile=None, outfile=None):
+    def __init__(self, infile=None, outfile=None, stream=None, compression=ZIP_DEFLATED, compresslevel=None):
         # the tag pattern
         self.pattern = PATTERN
-        # temp folder for converted files
-        self.temp_dir = tempfile.mkdtemp()
+        self.compression = compression
+        self.compresslevel = compresslevel
         self.infile = infile
-        if infile:
-            # input file specified
-            tmp_fname = infile
-        else:
-            # file taken as input file when not explicitly set:
-            tmp_fname = DEFAULT_FILE
-            infile = files(__name__).joinpath('word.docx')
-
-        with ZipFile(infile, 'r') as zin:
-            file_contents = zin.read('word/document.xml')
-            tmp_filename_full = path.join(self.temp_dir, path.splitext(path.basename(tmp_fname))[0])
-            self.tmp_file = ZipFile(tmp_filename_full, 'w', compression=ZIP_DEFLATED)
-            self.tmp_file.comment = zin.comment
-            for file in zin.namelist():
-                if file != 'word/document.xml':
-                    self.tmp_file.writestr(file, zin.read(file))
-
-        # extract always required namespaces
-        self.namespaces = {}
-        minidoc = parseString(file_contents)
-        for k, v in minidoc.documentElement.attributes.items():
-            if not k.startswith('xmlns:'):
-                continue
-            self.namespaces[k.replace('xmlns:', '', count=1)] = v
+        # the input package in memory, if not given as a path
+        self.package = None
+        if isinstance(infile, (bytes, bytearray, memoryview)):
+            self.package = infile
+        elif infile and not is_path(infile):
+            self.package = infile.read()
+        # the bytes of the document part between the children with tags, for
+        # templates
+        self.segments = None
+        # only the document part is read here, the others are copied as they
+        # are while writing
+        with ZipFile(self._open_package(), 'r') as zin:
+            info = zin.getinfo('word/document.xml')
+            if stream is None:
+                stream = info.file_size > STREAM_SIZE
+            # the whole body is replaced without an input file
+            self.stream = bool(stream and infile)
+            if self.stream:
+                with zin.open(info) as part:
+                    # the tagged children of the body and their places
+                    self.parts = self._scan(part)
+            else:
+                file_contents = zin.read(info)
 
-        # the xml tree representation of the document contents
-        self.doc_tree = ET.fromstring(file_contents)
+        if self.stream:
+            self.doc_tree = None
+        else:
+            # the namespaces declared on the root, captured while parsing
+            self.namespaces = {}
+            events = ET.iterparse(BytesIO(file_contents), events=('start-ns', 'start'))
+            for event, item in events:
+                if event == 'start':  # the root, the namespaces declared after are local
+                    break
+                prefix, uri = item
+                if prefix:
+                    self.namespaces[prefix] = uri
+            # the rest of the tree
+            for _ in events:
+                pass
+            # the xml tree representation of the document contents
+            self.doc_tree = events.root
         for prefix, uri in self.namespaces.items():
             ET.register_namespace(prefix, uri)
 
         # the tags in the document
-        self.tags = self.extract_tags(self.doc_tree)
+        if self.stream:
+            self.tags = [tag for _, _, holder in self.parts for tag in self.extract_body_tags(holder)]
+        else:
+            self.tags = self.extract_tags(self.doc_tree)
 
         if outfile:
-            self.outfile = path.abspath(outfile) 
+            self.outfile = path.abspath(outfile) if is_path(outfile) else outfile
+        elif self.package is not None:
+            self.outfile = BytesIO()
         elif self.infile:
             base, ext = path.splitext(self.infile)
             self.outfile = base + '-out' + ext
         else:
             self.outfile = DEFAULT_FILE
 
+    def _scan(self, part) -> list[tuple[int, int, ET.Element]]:
+        '''
+        read the document part once to find the children of the body with #
+        in them, which are parsed each into an element like the body, with
+        their start and end offsets in the part
+        '''
+        parser = expat.ParserCreate()
+        root_attrs = {}
+        body_attrs = {}
+        body = None
+        in_body = False
+        # the offsets of the children of the body, and of its end
+        starts = []
+        depth = 0
+
+        def start(name, attrs):
+            nonlocal depth, body, in_body
+            depth += 1
+            if depth == 1:
+                root_attrs.update(attrs)
+            elif depth == 2 and body is None and name.rpartition(':')[2] == 'body':
+                body = name
+                in_body = True
+                body_attrs.update(attrs)
+            elif depth == 3 and in_body:
+                starts.append(parser.CurrentByteIndex)
+
+        def end(name):
+            nonlocal depth, in_body
+            if depth == 2 and in_body:
+                starts.append(parser.CurrentByteIndex)
+                in_body = False
+            depth -= 1
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+
+        found = []
+        buffer = bytearray()
+        offset = 0  # of the buffer in the part
+        checked = 0  # the number of children checked
+        for chunk in iter(lambda: part.read(CHUNK_SIZE), b''):
+            buffer += chunk
+            parser.Parse(chunk, False)
+            while checked + 1 < len(starts):
+                child_start, child_end = starts[checked], starts[checked + 1]
+                child = buffer[child_start - offset:child_end - offset]
+                if b'#' in child:
+                    found.append((child_start, child_end, bytes(child)))
+                checked += 1
+            # only from the child not checked yet
+            keep = starts[checked] if checked < len(starts) else offset + len(buffer)
+            del buffer[:keep - offset]
+            offset = keep
+        parser.Parse(b'', True)
+
+        self.namespaces = {k.split(':', 1)[1]: v for k, v in root_attrs.items() if k.startswith('xmlns:')}
+        decls = ''.join(f' {k}={_quote(v)}' for k, v in {**root_attrs, **body_attrs}.items()
+                        if k == 'xmlns' or k.startswith('xmlns:'))
+        return [(child_start, child_end, ET.fromstring(f'<{body}{decls}>'.encode() + child + f'</{body}>'.encode()))
+                for child_start, child_end, child in found]
+
+    def _children_xml(self, holder: ET.Element, declared: set[str]) -> bytes:
+        '''
+        the xml of the children of the element, without the namespace
+        declarations in declared, which are on the root
+        '''
+        if not len(holder):
+            return b''
+        xml = ET.tostring(holder, encoding='unicode')
+        start_end = xml.index('>')
+        if all(decl in declared for decl in XMLNS_PATTERN.findall(xml, 0, start_end)):
+            # only the start and end tags of the holder to remove
+            return xml[start_end + 1:xml.rindex('</')].encode('utf-8')
+        # the others declared on each child
+        children_xml = []
+        for child in holder:
+            child_xml = ET.tostring(child, encoding='unicode')
+            start_end = child_xml.index('>')
+            children_xml.append(XMLNS_PATTERN.sub(lambda decl: '' if decl.group(0) in declared else decl.group(0),
+                                                  child_xml[:start_end]))
+            children_xml.append(child_xml[start_end:])
+        return ''.join(children_xml).encode('utf-8')
+
+    def _write_parts(self, zin: ZipFile, part):
+        '''
+        write the document part, with the children of the body that had tags
+        as they are now and the rest copied from the input, or from the
+        segments if made from a template
+        '''
+        declared = {f' xmlns:{prefix}={_quote(uri)}' for prefix, uri in self.namespaces.items()}
+        if self.segments is not None:
+            for segment, (_, _, holder) in zip(self.segments, self.parts):
+                part.write(segment)
+                part.write(self._children_xml(holder, declared))
+            part.write(self.segments[-1])
+            return
+        offset = 0
+        with zin.open('word/document.xml') as source:
+            for start, end, holder in self.parts:
+                copy_bytes(source, part, start - offset)
+                source.seek(end)
+                part.write(self._children_xml(holder, declared))
+                offset = end
+            while chunk := source.read(CHUNK_SIZE):
+                part.write(chunk)
+
+    def _open_package(self):
+        '''the binary file of the input package, the template if not given'''
+        if self.package is not None:
+            return BytesIO(self.package)
+        if self.infile:
+            return open(self.infile, 'rb')
+        # file taken as input file when not explicitly set:
+        return BytesIO(default_template())
+
+    def _write_package(self, write_part, size=None):
+        '''
+        write the output package, with the members of the input copied as they
+        are compressed and only the document part compressed again, written by
+        write_part(zin, part) with zin the input package. size is that of the
+        document part if it is known before writing it
+        '''
+        if not is_path(self.outfile):
+            self._write_zip(self.outfile, write_part, size)
+            return
+        # next to the output, to be moved in place at once when complete
+        tmp_filename = f'{self.outfile}.{token_hex(4)}.tmp'
+        try:
+            self._write_zip(tmp_filename, write_part, size)
+            replace(tmp_filename, self.outfile)
+        except BaseException:
+            if path.exists(tmp_filename):
+                remove(tmp_filename)
+            raise
+
+    def _write_zip(self, file, write_part, size=None):
+        '''write the output package to file, a path or a binary file object'''
+        with self._open_package() as source, ZipFile(source) as zin, \
+                ZipFile(file, 'w', compression=self.compression, compresslevel=self.compresslevel) as zout:
+            zout.comment = zin.comment
+            # if the internals of ZipFile it uses are there
+            copy_compressed = can_copy_member(zout)
+            for info in zin.infolist():
+                if info.filename == 'word/document.xml':
+                    self._write_document_part(zin, info, zout, write_part, size)
+                elif self.compression == ZIP_STORED and info.compress_type != ZIP_STORED:
+                    copy_decompressed(zin, info, zout, ZIP_STORED)
+                elif copy_compressed:
+                    copy_member(source, info, zout)
+                else:
+                    copy_decompressed(zin, info, zout)
+
+    def _write_document_part(self, zin: ZipFile, info: ZipInfo, zout: ZipFile, write_part, size=None):
+        '''
+        write the document part with write_part, compressed in a thread pool
+        if it is large
+        '''
+        # in its place, with its date
+        doc_info = ZipInfo(info.filename, info.date_time)
+        doc_info.compress_type = self.compression
+        doc_info.compress_level = self.compresslevel
+        doc_info.external_attr = info.external_attr
+        # for zipfile to know if it needs zip64. when it is not known, the
+        # values put in can make it larger than the template's, past the limit
+        if size is not None:
+            doc_info.file_size = size
+        with zout.open(doc_info, 'w', force_zip64=size is None) as part_out:
+            # only if the compressor of zipfile is the zlib one it is replaced
+            if self.compression != ZIP_DEFLATED or (info.file_size if size is None else size) <= PARALLEL_SIZE \
+                    or not can_compress_in_parallel(part_out):
+                write_part(zin, part_out)
+                return
+            workers = cpu_count() or 1
+            with ThreadPoolExecutor(workers) as pool:
+                # in place of the one of zipfile, which compresses it all in this thread
+                part_out._compressor = ParallelCompressor(pool, self.compresslevel, workers)
+                write_part(zin, part_out)
+                # flushed while the pool is there
+                part_out.close()
+
     def normalized_contents(self, paragraph):
         pref_w = f'{{{self.namespaces["w"]}}}'
         ignored = [pref_w + tag for tag in ['bookmarkStart', 'bookmarkEnd', 'proofErr']]
@@ -251,7 +503,7 @@ class document:
                     conts.append(['', child])
                 for t in child:
                     if t.tag == pref_w + 't':
-                        conts[-1][0] += t.text
+                        conts[-1][0] += t.text or ''
             elif conts and type(conts[-1]) != list or child.tag not in ignored:
                 conts.append(child)
         return conts
@@ -284,6 +536,7 @@ class document:
                     block=cont[0].strip() == '#' + match.group(2),
                     table=False, # can be modified by caller
                     index=index,
+                    run_index=len(para) - 1,
                 ))
             # remove \'s from the escaped #'s and change the tags form
             w_t.text = (re.sub(r'\\#', '#', self.pattern.sub(
@@ -295,16 +548,19 @@ class document:
         return tags
 
     def extract_tags(self, tree) -> list[TagWord]:
+        return self.extract_body_tags(tree[0])
+
+    def extract_body_tags(self, body: ET.Element) -> list[TagWord]:
         pref_w = f'{{{self.namespaces["w"]}}}'
         tags = []
-        for index, child in enumerate(tree[0]):
+        for index, child in enumerate(body):
             if child.tag == pref_w + 'p':
-                tags += self.extract_paragraph_tags(tree[0], child, index)
+                tags += self.extract_paragraph_tags(body, child, index)
             elif child.tag == pref_w + 'tbl':
-                for tr in child:
-                    if tr.tag != pref_w + 'tr':
-                        continue
-                    for tc in tr:
+                rows = [tr for tr in child if tr.tag == pref_w + 'tr']
+                table = TableWord(child, rows, [[tc for tc in tr if tc.tag == pref_w + 'tc'] for tr in rows])
+                for i_row, cells in enumerate(table.cells):
+                    for i_col, tc in enumerate(cells):
                         cell_tags: list[TagWord] = []
                         for i, p in enumerate(tc):
                             if p.tag == pref_w + 'p':
@@ -320,113 +576,110 @@ class document:
                             continue
                         # table tag
                         tag.table = True
-                        tag.tbl = child
-                        tag.tbl_row = tr
+                        tag.tbl = table
+                        tag.row = i_row
+                        tag.col = i_col
                         tags.append(tag)
         return tags
 
-    def _subs_tags(self, values={}):
+    def _convert(self, values) -> tuple[dict, dict]:
+        '''
+        the paragraphs of the content of each tag, and the values of the table
+        tags, from (tag, part) pairs, converted in batches as they come
+        '''
+        table_tags = {tag.name for tag in self.tags if tag.table}
+        paras: dict[str, list] = {}
+        tables: dict[str, list] = {}
+        batches: dict[str, list] = {}
+        for name, part in values:
+            tag_paras = paras.setdefault(name, [])
+            if part[0] == 'table' and name in table_tags:
+                tables.setdefault(name, []).append(part[1])
+                continue
+            batch = batches.setdefault(name, [])
+            batch.append(part)
+            # a new paragraph starts after these, so converting the batch
+            # does not split one
+            if len(batch) >= BATCH_SIZE and (part[0] not in ['text', 'inline'] or not part[1].strip()):
+                tag_paras += self.para_elts(batch)
+                batch.clear()
+        for name, batch in batches.items():
+            paras[name] += self.para_elts(batch)
+        return paras, tables
+
+    def _subs_tags(self, paras: dict, tables: dict):
+        pref_w = f'{{{self.namespaces["w"]}}}'
         matched_tags = {}
-        added: dict[ET.Element, int] = {}  # the added index to make up for the added elements
+        # the number of elements added to each paragraph or parent of
+        # paragraphs so far, all before the places of the tags left as they
+        # are in order
+        added: dict[ET.Element, int] = {}
         for tag in self.tags:
             loc_parent, loc_para, loc_run, loc_text = tag.address
-            if tag.name not in values:
+            if tag.name not in paras:
                 logger.warning(f'There is nothing to send to #{tag.name}.')
                 # remove this entry to revert the left ones from their alt form
                 loc_text.text = loc_text.text.replace(tag.alt, '#' + tag.name)
                 continue
+            sent = tag.name in matched_tags
             matched_tags[tag.name] = True
             if tag.table:
                 # fill table with matrix values
-                for position, value in values[tag.name]:
-                    if position != 'table':
-                        continue
-                    i_row_init = None
-                    j_col_init = None
-                    n_init_rows = None
-                    n_init_cols = None
-                    pref_w = f'{{{self.namespaces["w"]}}}'
-                    for i, cr in enumerate(tag.tbl):
-                        if cr.tag != pref_w + 'tr':
-                            continue
-                        if n_init_rows is not None:
-                            n_init_rows += 1
-                        if cr != tag.tbl_row:
-                            continue
-                        n_init_rows = 1
-                        i_row_init = i
-                        for j, cc in enumerate(cr):
-                            if cc.tag != pref_w + 'tc':
-                                continue
-                            if n_init_cols is not None:
-                                n_init_cols += 1
-                            if cc == loc_parent:
-                                n_init_cols = 1
-                                j_col_init = j
-                    for i, row_val in enumerate(value):
-                        if n_init_rows < i + 1:
-                            row_val_element = ET.Element(pref_w + 'tr')
-                            for j in range(n_init_cols):
-                                row_val_element.append(ET.Element(pref_w + 'tc'))
-                                j_col_init = 0 # because this is a new row
-                            tag.tbl.append(row_val_element)
-                        else:
-                            row_val_element = tag.tbl[i + i_row_init]
-                        for j, val in enumerate(row_val):
-                            if n_init_cols < j + 1:
-                                col_val_element = ET.Element(pref_w + 'tc')
-                                row_val_element.append(col_val_element)
-                            else:
-                                col_val_element = row_val_element[j + j_col_init]
-                                for elm in col_val_element:
-                                    if elm.tag == pref_w + 'p':
-                                        col_val_element.remove(elm)
-                            value_para = self.para_elts([('inline', val)])[0]
-                            col_val_element.append(value_para)
+                table = tag.tbl
+                for value in tables.get(tag.name, []):
+                    for i, row_paras in enumerate(self.cell_elts(value)):
+                        i_row = tag.row + i
+                        if i_row == len(table.rows):
+                            # as many cells as the row of the tag
+                            row = ET.SubElement(table.tbl, pref_w + 'tr')
+                            table.rows.append(row)
+                            table.cells.append([ET.SubElement(row, pref_w + 'tc') for _ in table.cells[tag.row]])
+                        row, cells = table.rows[i_row], table.cells[i_row]
+                        for j, value_para in enumerate(row_paras):
+                            while len(cells) <= tag.col + j:
+                                cells.append(ET.SubElement(row, pref_w + 'tc'))
+                            cell = cells[tag.col + j]
+                            for para in cell.findall(pref_w + 'p'):
+                                cell.remove(para)
+                            cell.append(value_para)
                 else:
                     matched_tags[tag.name] = False
                 continue
-            ans_parts = [*self.para_elts(values[tag.name])]
-            added_current = added.setdefault(loc_para, 0)
+            # a copy for the tags sent to again
+            ans_parts = deepcopy(paras[tag.name]) if sent else [*paras[tag.name]]
+            index_para = tag.index + added.get(loc_parent, 0)
             if tag.block:
-                ans_parts.reverse()  # because they are inserted at the same index
-                for ans in ans_parts:
-                    loc_parent.insert(tag.index + added_current, ans)
-                loc_parent.remove(loc_para)
-                added[loc_para] += len(ans_parts) - 1  # minus the tag para (removed)
+                if loc_parent[index_para] is not loc_para:
+                    index_para = list(loc_parent).index(loc_para)
+                # in place of the tag para
+                loc_parent[index_para:index_para + 1] = ans_parts
+                added[loc_parent] = added.get(loc_parent, 0) + len(ans_parts) - 1
                 continue
             # inline
             split_text = loc_text.text.split(tag.alt, 1)
             loc_text.text = split_text[1]
-            index_run = list(loc_para).index(loc_run)
-            pref_w = f'{{{self.namespaces["w"]}}}'
+            beg_run = ET.Element(pref_w + 'r')
+            beg_text = ET.SubElement(beg_run, pref_w + 't',
+                                     {'xml:space': 'preserve'})
+            beg_text.text = split_text[0]
             # if there is only one para, insert its contents into the para
             if len(ans_parts) == 1:
-                ans_runs = list(ans_parts[0])
-                ans_runs.reverse()  # same reason as above
-                for run in ans_runs:
-                    loc_para.insert(index_run, run)
-                beg_run = ET.Element(pref_w + 'r')
-                beg_text = ET.SubElement(beg_run, pref_w + 't',
-                                         {'xml:space': 'preserve'})
-                beg_text.text = split_text[0]
-                loc_para.insert(index_run, beg_run)
+                index_run = tag.run_index + added.get(loc_para, 0)
+                if loc_para[index_run] is not loc_run:
+                    index_run = list(loc_para).index(loc_run)
+                ans_runs = [beg_run, *ans_parts[0]]
+                loc_para[index_run:index_run] = ans_runs
+                added[loc_para] = added.get(loc_para, 0) + len(ans_runs)
                 continue
             # split the para and make new paras between the splits
             beg_para = ET.Element(pref_w + 'p')
-            beg_run = ET.SubElement(beg_para, pref_w + 'r')
-            beg_text = ET.SubElement(beg_run, pref_w + 't',
-                                     {'xml:space': 'preserve'})
-            beg_text.text = split_text[0]
-            ans_parts.reverse()  # same reason as above
-            for ans in ans_parts:
-                loc_parent.insert(tag.index + added_current, ans)
-            beg_index = tag.index + added_current
-            loc_parent.insert(beg_index, beg_para)
-            added[loc_para] += len(ans_parts) + 1
-        for tag in values:
-            if tag not in matched_tags:
-                logger.warning(f'#{tag.name} not found in the document.')
+            beg_para.append(beg_run)
+            ans_parts.insert(0, beg_para)
+            loc_parent[index_para:index_para] = ans_parts
+            added[loc_parent] = added.get(loc_parent, 0) + len(ans_parts)
+        for name in paras:
+            if name not in matched_tags:
+                logger.warning(f'#{name} not found in the document.')
 
     def collect_txt(self, content):
         paras = []
@@ -471,51 +724,96 @@ class document:
         return paras
 
     def para_elts(self, content: list):
+        '''the paragraphs of the content, parsed all at once'''
         w = self.namespaces['w']
         m = self.namespaces['m']
-        para_start = f'<w:p xmlns:w="{w}" xmlns:m="{m}">'
-        para_form = para_start + '{}</w:p>'
         run_form = '<w:r><w:t xml:space="preserve">{}</w:t></w:r>'
-        paras = []
+        paras_xml = []
         for para in self.collect_txt(content):
-            para_xml_ls = []
+            paras_xml.append('<w:p>')
             for part in para:
                 if part[0] == 'text':
                     if part[1].strip():
-                        para_xml_ls.append(run_form.format(part[1]))
+                        paras_xml.append(run_form.format(part[1]))
                 else:
-                    para_xml_ls.append(part[1])
-            para_xml = para_form.format(''.join(para_xml_ls))
-            paras.append(ET.fromstring(para_xml))
+                    paras_xml.append(part[1])
+            paras_xml.append('</w:p>')
+        # the namespaces declared once for all
+        return list(ET.fromstring(f'<w:body xmlns:w="{w}" xmlns:m="{m}">{"".join(paras_xml)}</w:body>'))
 
-        return paras
+    def cell_elts(self, table: list) -> list:
+        '''the paragraphs of the table cells, parsed all at once'''
+        w = self.namespaces['w']
+        m = self.namespaces['m']
+        cells_xml = ''.join('<w:p>' + val + '</w:p>' for row_val in table for val in row_val)
+        cells = iter(ET.fromstring(f'<w:tc xmlns:w="{w}" xmlns:m="{m}">{cells_xml}</w:tc>'))
+        return [[next(cells) for _ in row_val] for row_val in table]
 
     def write(self, values={}):
+        '''
+        write the document with the values, a dict of the tags and their
+        parts or (tag, part) pairs as they are rendered, which are converted
+        as they come instead of being kept until the end
+        '''
+        if isinstance(values, Mapping):
+            values = ((tag, part) for tag, parts in values.items() for part in parts)
+        paras, tables = self._convert(values)
         if self.infile:
-            self._subs_tags(values)
+            self._subs_tags(paras, tables)
         else:
-            for child in self.doc_tree[0]:
-                self.doc_tree[0].remove(child)
-            for val in values.values():
-                for para in self.para_elts(val):
-                    self.doc_tree[0].append(para)
-        # take care of namespaces and declaration
+            # all in place of the contents, before the section properties
+            body = self.doc_tree[0]
+            body[:] = [para for tag_paras in paras.values() for para in tag_paras] \
+                + body.findall(f'{{{self.namespaces["w"]}}}sectPr')
+        logger.info('[writing file] %s', self.outfile)
+        if self.stream:
+            self._write_package(self._write_parts)
+            return
+        # the namespaces not used in the tree are declared on the root too
         doc_xml = ET.tostring(self.doc_tree, encoding='unicode')
-        searched = re.match(r'\<w:document.*?\>', doc_xml).group(0)
-        used_nses = re.findall(r'(?<=xmlns\:)\w+', searched)
-        for prefix, uri in self.namespaces.items():
-            if prefix not in used_nses:
-                self.doc_tree.set('xmlns:' + prefix, uri)
+        root_end = doc_xml.index('>')
+        if doc_xml[root_end - 1] == '/':  # empty, ' />'
+            root_end -= 2
+        used_nses = re.findall(r'(?<=xmlns\:)\w+', doc_xml[:root_end])
+        unused = ''.join(f' xmlns:{prefix}={_quote(uri)}'
+                         for prefix, uri in self.namespaces.items() if prefix not in used_nses)
+        doc_xml = (self.declaration + doc_xml[:root_end] + unused + doc_xml[root_end:]).encode('utf-8')
+        self._write_package(lambda zin, part: part.write(doc_xml), len(doc_xml))
 
-        doc_xml = self.declaration + \
-            ET.tostring(self.doc_tree, encoding='unicode')
-        self.tmp_file.writestr('word/document.xml', doc_xml)
-        tmp_filename = self.tmp_file.filename
-        self.tmp_file.close()
 
-        logger.info('[writing file] %s', self.outfile)
-        move(tmp_filename, self.outfile)
 
-        rmtree(self.temp_dir)
 
+class template:
+    '''
+    a word document compiled once to be rendered many times. Its document
+    part is kept as the bytes between the children of the body with tags,
+    which are kept parsed, so that the documents made from it with
+    document() are written without parsing it again
+    '''
 
+    def __init__(self, infile):
+        self.infile = infile
+        # only the children with tags are parsed in stream mode
+        self.doc = document(infile, stream=True)
+        if self.doc.package is None:
+            with open(infile, 'rb') as file:
+                self.doc.package = file.read()
+        with ZipFile(BytesIO(self.doc.package)) as zin:
+            part = zin.read('word/document.xml')
+        bounds = [0, *[offset for start, end, _ in self.doc.parts for offset in [start, end]], len(part)]
+        self.doc.segments = [part[bounds[i]:bounds[i + 1]] for i in range(0, len(bounds), 2)]
+        self.tags = self.doc.tags
+
+    def document(self, outfile=None, compression=ZIP_DEFLATED, compresslevel=None) -> document:
+        '''a document to write the template with values to'''
+        doc = copy(self.doc)
+        doc.compression = compression
+        doc.compresslevel = compresslevel
+        # only what is written to is copied, with the tags pointing to the copies
+        doc.parts, doc.tags = deepcopy((self.doc.parts, self.doc.tags))
+        if outfile:
+            doc.outfile = path.abspath(outfile) if is_path(outfile) else outfile
+        elif not is_path(doc.outfile):
+            # not the same one for all
+            doc.outfile = BytesIO()
+        return doc
@@ -0,0 +1,129 @@
+'''
+copying the members of zip packages as they are compressed, without
+decompressing and compressing them again, and compressing large members in
+pieces at the same time
+'''
+
+import struct
+import zlib
+from copy import copy
+from collections import deque
+from zipfile import ZipFile, ZipInfo, BadZipFile, sizeFileHeader, structFileHeader, stringFileHeader
+
+# the size of the pieces of the compressed data copied at a time
+CHUNK_SIZE = 1 << 20
+# the flag of the sizes and the crc coming after the data instead of in the header
+FLAG_DATA_DESCRIPTOR = 0x08
+# the number of raw deflate window bits, as used in zip files
+DEFLATE_WBITS = -15
+# the type of the compressors of zlib
+ZLIB_COMPRESSOR = type(zlib.compressobj())
+# the internals of ZipFile used to add the members as they are compressed,
+# not part of its API
+ZIPFILE_INTERNALS = ('_lock', '_writing', '_writecheck', '_didModify', 'start_dir', 'filelist', 'NameToInfo', 'fp')
+
+
+def can_copy_member(zout: ZipFile) -> bool:
+    '''whether copy_member can be used with zout, otherwise copy_decompressed'''
+    return all(hasattr(zout, name) for name in ZIPFILE_INTERNALS)
+
+
+def copy_member(source, info: ZipInfo, zout: ZipFile):
+    '''
+    copy the member with info from source, the binary file of the package it
+    is in, to zout as it is compressed. Only if can_copy_member(zout)
+    '''
+    source.seek(info.header_offset)
+    header = struct.unpack(structFileHeader, source.read(sizeFileHeader))
+    if header[0] != stringFileHeader:
+        raise BadZipFile(f'Bad magic number for file header of {info.filename}')
+    # skip the name and the extra field
+    source.seek(header[10] + header[11], 1)
+
+    zinfo = copy(info)
+    # the sizes and the crc are known, they go in the header
+    zinfo.flag_bits &= ~FLAG_DATA_DESCRIPTOR
+    # the same way as ZipFile.writestr adds the members
+    with zout._lock:
+        if zout._writing:
+            raise ValueError(f"Can't copy {info.filename} while a member of the package is being written")
+        zinfo.header_offset = zout.fp.tell()
+        zout._writecheck(zinfo)
+        zout._didModify = True
+        zout.fp.write(zinfo.FileHeader())
+        copy_bytes(source, zout.fp, info.compress_size)
+        zout.filelist.append(zinfo)
+        zout.NameToInfo[zinfo.filename] = zinfo
+        zout.start_dir = zout.fp.tell()
+
+
+def copy_bytes(source, dest, size: int):
+    '''copy size bytes from the binary file source to dest, in chunks'''
+    while size:
+        chunk = source.read(min(size, CHUNK_SIZE))
+        if not chunk:
+            raise BadZipFile('Truncated data')
+        dest.write(chunk)
+        size -= len(chunk)
+
+
+def can_compress_in_parallel(dest) -> bool:
+    '''
+    whether dest, a member of a ZipFile opened for writing, compresses with
+    a zlib compressor that a ParallelCompressor can take the place of
+    '''
+    return isinstance(getattr(dest, '_compressor', None), ZLIB_COMPRESSOR)
+
+
+class ParallelCompressor:
+    '''
+    a deflate compressor like the ones of zlib used by zipfile, compressing
+    the pieces of the data of CHUNK_SIZE each on its own in the thread pool,
+    where zlib works without the GIL. Each piece ends on a byte boundary so
+    that they make a single deflate stream together.
+    '''
+
+    def __init__(self, pool, level: int | None = None, workers: int = 1):
+        self.pool = pool
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        # the ones more than these waited for, not to keep all in memory
+        self.max_pending = 2 * workers
+        self.data = bytearray()
+        self.pending = deque()
+
+    def _deflate(self, data: bytes, mode: int) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, DEFLATE_WBITS)
+        return compressor.compress(data) + compressor.flush(mode)
+
+    def compress(self, data) -> bytes:
+        '''the compressed data of the pieces done so far, in order'''
+        self.data += data
+        while len(self.data) >= CHUNK_SIZE:
+            self.pending.append(self.pool.submit(self._deflate, bytes(self.data[:CHUNK_SIZE]), zlib.Z_SYNC_FLUSH))
+            del self.data[:CHUNK_SIZE]
+        done = []
+        while self.pending and (self.pending[0].done() or len(self.pending) > self.max_pending):
+            done.append(self.pending.popleft().result())
+        return b''.join(done)
+
+    def flush(self) -> bytes:
+        '''the compressed data of the rest, ending the stream'''
+        self.pending.append(self.pool.submit(self._deflate, bytes(self.data), zlib.Z_FINISH))
+        self.data.clear()
+        done = [piece.result() for piece in self.pending]
+        self.pending.clear()
+        return b''.join(done)
+
+
+def copy_decompressed(zin: ZipFile, info: ZipInfo, zout: ZipFile, compress_type: int | None = None):
+    '''
+    copy the member with info from zin to zout, decompressed and compressed
+    again with compress_type, its own if not given
+    '''
+    zinfo = copy(info)
+    if compress_type is not None:
+        zinfo.compress_type = compress_type
+    zinfo.compress_level = zout.compresslevel
+    with zin.open(info) as source, zout.open(zinfo, 'w') as dest:
+        while chunk := source.read(CHUNK_SIZE):
+            dest.write(chunk)
@@ -0,0 +1,245 @@
+'''
+Module jobs
+
+runs calculation scripts into documents, one at a time or many at once in a
+pool of worker processes that load the backends only once
+'''
+
+from json import load
+from os import path, stat
+from importlib import import_module
+from functools import cache, lru_cache
+from . import processor
+from .sweeping import read_cases
+from .profiling import Profile, record, stage
+
+# the modules of the document handlers and of the parsers of calculation files
+# by the extensions of the files they handle, imported only when used. Other
+# packages can add their own with entry points in the groups below, named
+# after the extension (without the dot).
+HANDLERS = {
+    '.tex': 'docal.document.latex',
+    '.docx': 'docal.document.word',
+}
+PARSERS = {
+    '.xlsx': 'docal.parsers.excel',
+    '.dcl': 'docal.parsers.dcl',
+}
+HANDLERS_GROUP = 'docal.handlers'
+PARSERS_GROUP = 'docal.parsers'
+
+
+@cache
+def _entry_points(group: str) -> dict:
+    # only looked up for the extensions not built in, it is slow
+    from importlib.metadata import entry_points
+    return {'.' + entry.name: entry for entry in entry_points(group=group)}
+
+
+def _module(registry: dict, group: str, extension: str):
+    if extension in registry:
+        return import_module(registry[extension])
+    entry = _entry_points(group).get(extension)
+    return None if entry is None else entry.load()
+
+
+def _registry(group: str) -> dict:
+    return HANDLERS if group == HANDLERS_GROUP else PARSERS
+
+
+def supported(group: str, extension: str) -> bool:
+    '''whether the files with the extension are handled by a module of the group'''
+    return extension in _registry(group) or extension in _entry_points(group)
+
+
+def extensions(group: str) -> list[str]:
+    '''the extensions of the files handled by the modules of the group'''
+    return [*_registry(group), *_entry_points(group)]
+
+
+def handler(extension: str):
+    '''the module of the document handler for the extension'''
+    module = _module(HANDLERS, HANDLERS_GROUP, extension)
+    if module is None:
+        raise ValueError(f"There is no document handler for '{extension}' files.")
+    return module
+
+
+def _extension(infile=None, outfile=None) -> str:
+    '''the extension of the document, the input if given'''
+    if not (infile or outfile):
+        raise ValueError('There is neither an input nor an output document.')
+    return path.splitext(infile or outfile)[1]
+
+
+# syntax objects by handler, created once per process
+_syntaxes = {}
+
+
+def _syntax(module):
+    if module not in _syntaxes:
+        _syntaxes[module] = module.syntax()
+    return _syntaxes[module]
+
+
+@lru_cache(maxsize=8)
+def _template(module, infile: str, mtime: int, size: int):
+    '''the template of the input document, compiled once while it is the same'''
+    return module.template(infile)
+
+
+def _document(module, infile=None, outfile=None, compiled=False):
+    '''
+    the document of the handler, made from a template of the input compiled
+    once per process with compiled, if the handler has them
+    '''
+    if not (compiled and infile and hasattr(module, 'template')):
+        return module.document(infile, outfile)
+    info = stat(infile)
+    return _template(module, path.abspath(infile), info.st_mtime_ns, info.st_size).document(outfile)
+
+
+def read_instructions(script: str) -> str:
+    '''read the calculation file into a python script'''
+    calculation = path.abspath(script)
+    kind = path.splitext(calculation)[1]
+    if kind == '.py':
+        with open(script, encoding='utf-8') as file:
+            return file.read()
+    parser = _module(PARSERS, PARSERS_GROUP, kind)
+    if parser is None:
+        return ''
+    return parser.parse(calculation)
+
+
+def _pairs(infiles: list[str], outfiles: list[str]) -> list[tuple]:
+    '''
+    the input and output of each document, each output with the first input
+    of the same kind left, and the inputs without outputs to their defaults
+    '''
+    inputs = list(infiles)
+    pairs = []
+    for outfile in outfiles:
+        extension = path.splitext(outfile)[1]
+        infile = next((i for i in inputs if path.splitext(i)[1] == extension), None)
+        if infile is not None:
+            inputs.remove(infile)
+        pairs.append((infile, outfile))
+    return pairs + [(infile, None) for infile in inputs]
+
+
+def run_job(script=None, infile=None, outfile=None, clear=False, log_level=None, overrides=None,
+            profile=False, compiled=False) -> Profile | None:
+    '''
+    process the script and inject the results into the document, returning
+    the times spent on each part if profile is set. With compiled, the input
+    document is compiled once per process to render it again faster. The
+    inputs and outputs can be lists, for documents of different kinds made
+    from a single run of the script.
+    '''
+    infiles = [infile] if isinstance(infile, str) else list(infile or [])
+    outfiles = [outfile] if isinstance(outfile, str) else list(outfile or [])
+    docs = []
+    for infile, outfile in _pairs(infiles, outfiles) or [(None, None)]:
+        module = handler(_extension(infile, outfile))
+        docs.append((module, _document(module, infile, outfile, compiled)))
+    module, doc = docs[0]
+    proc = processor(_syntax(module), doc.tags, log_level, overrides=overrides, profile=profile)
+    # rendered for the others while the first is written
+    renderers = [proc.render_to(_syntax(module), other.tags) for module, other in docs[1:]]
+    # the parts are written as they are rendered
+    values = {}
+    if not clear:
+        values = proc.stream(read_instructions(script))
+        if profile:
+            # rendered before, so that the time of writing is its own
+            values = list(values)
+    with record(proc.profile, None, 'document'), stage('write'):
+        doc.write(values)
+        for renderer, (_, other) in zip(renderers, docs[1:]):
+            other.write(renderer.contents)
+    return proc.profile
+
+
+def run_sweep(script, cases, infile=None, outfile=None, table=None, workers=None, log_level=None) -> list[str]:
+    '''
+    process the script for each case in the cases (see sweeping.read_cases).
+    With a table name, the results of all the cases are put in that table
+    tag of a single document, otherwise a document is produced for each
+    case, numbered after the output (or input) name. Returns the errors.
+    '''
+    cases = read_cases(cases)
+    if table is not None:
+        module = handler(_extension(infile, outfile))
+        doc = module.document(infile, outfile)
+        proc = processor(_syntax(module), doc.tags, log_level)
+        content = read_instructions(script)
+        proc.sweep(content, cases, table, workers=workers)
+        doc.write(proc.stream(content))
+        return []
+    base, ext = path.splitext(outfile or infile)
+    if outfile is None and ext == '.docx':
+        # like the default output of the word document
+        base += '-out'
+    jobs = []
+    n_cases = len(next(iter(cases.values()), []))
+    for i in range(n_cases):
+        jobs.append({
+            'script': script,
+            'input': infile,
+            'output': f'{base}-{i + 1}{ext}',
+            'overrides': {name: values[i] for name, values in cases.items()},
+        })
+    return run_jobs(jobs, workers, log_level)
+
+
+def read_manifest(filename: str) -> list[dict]:
+    '''
+    read the jobs from a JSON file containing a list of objects with the keys
+    script, input and output. Relative paths are taken from the directory of
+    the manifest.
+    '''
+    with open(filename, encoding='utf-8') as file:
+        entries = load(file)
+    base = path.dirname(path.abspath(filename))
+    jobs = []
+    for entry in entries:
+        job = {}
+        for key in ['script', 'input', 'output']:
+            if entry.get(key):
+                job[key] = path.join(base, entry[key])
+        if 'input' not in job and 'output' not in job:
+            raise ValueError(f'The job {entry} has neither an input nor an output document.')
+        jobs.append(job)
+    return jobs
+
+
+def _init_worker(extensions: list[str]):
+    '''load what is shared between the jobs once for the worker'''
+    for extension in extensions:
+        module = handler(extension)
+        _syntax(module)
+        if hasattr(module, 'default_template'):
+            module.default_template()
+
+
+def _run_job_entry(job: dict, log_level=None) -> str | None:
+    '''run the job in a worker, returning the error message if it fails'''
+    try:
+        run_job(job.get('script'), job.get('input'), job.get('output'), log_level=log_level,
+                overrides=job.get('overrides'), compiled=True)
+    except Exception as exc:
+        return f'{job.get("script")}: {exc}'
+    return None
+
+
+def run_jobs(jobs: list[dict], workers=None, log_level=None) -> list[str]:
+    '''run the jobs in a pool of worker processes, returning the errors'''
+    # only when needed, it takes long to import
+    from concurrent.futures import ProcessPoolExecutor
+    # only the handlers of the jobs
+    extensions = list({_extension(job.get('input'), job.get('output')) for job in jobs})
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(extensions,)) as pool:
+        results = pool.map(_run_job_entry, jobs, [log_level] * len(jobs))
+        return [error for error in results if error is not None]
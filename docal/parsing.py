@@ -7,8 +7,10 @@ https://stackoverflow.com/questions/3867028/converting-a-python-numeric-expressi
 
 import ast
 import re
+import math
 import logging
 from typing import Iterable
+from .rendering import math_syntax, join
 
 log = logging.getLogger(__name__)
 
@@ -33,24 +35,112 @@ operators = {
 
 NUMPY_TYPES = ['numpy.ndarray', 'numpy.matrix']
 
-def mat_to_list(quantity):
+def _is_numpy(quantity) -> bool:
     quantity_type = str(type(quantity))
-    if any([typ in quantity_type for typ in NUMPY_TYPES]):
+    return any([typ in quantity_type for typ in NUMPY_TYPES])
+
+
+def mat_to_list(quantity):
+    if _is_numpy(quantity):
         quantity = quantity.tolist()
     return quantity
 
 
+def format_number(value, decimal=3, syntax=None) -> str:
+    '''
+    the number as it appears in equations, in scientific notation if it is too
+    big or too small
+    '''
+    if value != 0 and (abs(value) > 1000 or abs(value) < 0.1):
+        num_ls = (f'%.{decimal}E' % value).split('E')
+        # remove the preceding zeros and + in the powers like +07 to just 7
+        num_ls[1] = num_ls[1][0].lstrip('+') + num_ls[1][1:].lstrip('0')
+        # make them appear as powers of 10
+        return syntax.txt(num_ls[0]) + syntax.delmtd(syntax.sup(syntax.txt('10'), syntax.txt(num_ls[1])))
+    if value == int(value):
+        return syntax.txt(str(int(value)))
+    return syntax.txt(str(round(value, decimal)))
+
+
+def format_table(value, decimal=3, syntax=None) -> list[list[str]]:
+    '''
+    the cells of the 2D value as inline equations, with the numbers formatted
+    directly and each distinct one only once
+    '''
+    space = syntax.txt(syntax.halfsp)
+    # negative numbers are shown like the unary minus of to_math
+    minus = syntax.txt(syntax.minus) + syntax.txt(' ')
+    formatted = {}
+    table = []
+    for row in mat_to_list(value):
+        if not isinstance(row, Iterable):
+            continue
+        cells = []
+        for col in row:
+            kind = type(col)
+            # finite built in numbers, the zeros for their sign
+            if (kind is int or kind is float) and col and col - col == 0:
+                cell = formatted.get(col)
+                if cell is None:
+                    num = minus + format_number(-col, decimal, syntax) if col < 0 \
+                        else format_number(col, decimal, syntax)
+                    cell = formatted[col] = syntax.math_inln(num + space)
+            else:
+                cell = syntax.math_inln(to_math(col, decimal=decimal, syntax=syntax) + space)
+            cells.append(cell)
+        table.append(cells)
+    return table
+
+
+def _literal(value, text=repr):
+    '''
+    the AST of the value as it would be parsed from its text, made directly
+    for the built in numbers
+    '''
+    kind = type(value)
+    if kind is int or kind is float:
+        if value != value:
+            return ast.Name('nan', ast.Load())
+        if value < 0 or (kind is float and math.copysign(1, value) < 0):
+            return ast.UnaryOp(ast.USub(), _literal(-value))
+        if value == math.inf:
+            return ast.Name('inf', ast.Load())
+        return ast.Constant(value)
+    if kind is bool or value is None or (kind is str and text is repr):
+        return ast.Constant(value)
+    return ast.parse(text(value)).body[0].value
+
+
+def _native(value):
+    '''the numpy values in the list as python ones, like with tolist'''
+    if _is_numpy(value) or type(value).__module__ == 'numpy':
+        return value.tolist()
+    if type(value) is list:
+        return [_native(v) for v in value]
+    return value
+
+
+def _node(value):
+    '''the AST of the value as it would be parsed from its repr'''
+    if type(value) is list:
+        return ast.List([_node(v) for v in value], ast.Load())
+    if type(value) is tuple:
+        return ast.Tuple([_node(v) for v in value], ast.Load())
+    return _literal(value)
+
+
 def _prep4lx(quantity, syn_obj, mat_size=(DEFAULT_MAT_SIZE, DEFAULT_MAT_SIZE)):
     '''
-    parse the given quantity to an AST object so it can be integrated in _LatexVisitor
+    make an AST object of the given quantity so it can be integrated in _LatexVisitor
     '''
 
+    if _is_numpy(quantity) and quantity.ndim == 0:
+        quantity = quantity.item()
     if isinstance(quantity, Iterable):
         if isinstance(mat_size, int):
             mat_size = (mat_size, mat_size)
-        quantity = _fit_matrix(mat_to_list(quantity), syn_obj, mat_size)
-
-    return ast.parse(str(quantity)).body[0]
+        return ast.Expr(_node(_fit_matrix(quantity, syn_obj, mat_size)))
+    return ast.Expr(_literal(quantity, str))
 
 
 def _fit_big_matrix(matrix, syn_obj, size):
@@ -63,7 +153,7 @@ def _fit_big_matrix(matrix, syn_obj, size):
     for row in matrix[:rows - 2]:
         mat_new.append([*row[:cols - 2], syn_obj.cdots, row[-1]])
     mat_new.append([*([syn_obj.vdots] * (cols - 2)), syn_obj.ddots, matrix[-2][-1]])
-    mat_new.append(matrix[-1][:rows - 1] + [matrix[-1][-1]])
+    mat_new.append([*matrix[-1][:rows - 1], matrix[-1][-1]])
 
     return mat_new
 
@@ -80,13 +170,14 @@ def _fit_wide_matrix(matrix, syn_obj, max_cols):
     return mat_new
 
 
-def _fit_long_matrix(matrix, syn_obj, max_rows):
+def _fit_long_matrix(matrix, syn_obj, max_rows, vector=False):
     '''
     shorten the matrix by substituting vertical ... in the columns
     '''
 
-    mat_new = matrix[:max_rows - 2]
-    mat_new.append([syn_obj.vdots] * len(mat_new[0]))
+    mat_new = [*matrix[:max_rows - 2]]
+    # a single one for a vector
+    mat_new.append(syn_obj.vdots if vector else [syn_obj.vdots] * len(mat_new[0]))
     mat_new.append(matrix[-1])
 
     return mat_new
@@ -94,12 +185,19 @@ def _fit_long_matrix(matrix, syn_obj, max_rows):
 
 def _fit_matrix(matrix, syn_obj, max_size=(DEFAULT_MAT_SIZE, DEFAULT_MAT_SIZE)):
     '''
-    if there is a need, make the given matrix smaller
+    if there is a need, make the given matrix smaller. Numpy arrays are only
+    indexed for the parts that are shown.
     '''
 
-    shape = [len(matrix)]
-    cols = 1
-    if len(matrix) > 0:
+    if _is_numpy(matrix):
+        if 'numpy.matrix' in str(type(matrix)):
+            # as an array, whose rows are not matrices
+            matrix = matrix.A
+        shape = [matrix.shape[0], matrix.shape[1] if matrix.ndim > 1 else 1]
+        mat_ls = matrix
+        vector = matrix.ndim == 1
+    else:
+        cols = 1
         mat_ls = []
         for row in matrix:
             if isinstance(row, Iterable):
@@ -107,18 +205,20 @@ def _fit_matrix(matrix, syn_obj, max_size=(DEFAULT_MAT_SIZE, DEFAULT_MAT_SIZE)):
                 if cols == 1:
                     cols = len(row)
             mat_ls.append(row)
-    else:
-        mat_ls = []
-    shape.append(cols)
+        shape = [len(mat_ls), cols]
+        vector = not mat_ls or not isinstance(mat_ls[0], Iterable)
     # too big -> small
     if shape[0] > max_size[0] and shape[1] > max_size[1]:
         mat_ls = _fit_big_matrix(mat_ls, syn_obj, max_size)
     # too long -> small
     elif shape[0] > max_size[0]:
-        mat_ls = _fit_long_matrix(mat_ls, syn_obj, max_size[0])
+        mat_ls = _fit_long_matrix(mat_ls, syn_obj, max_size[0], vector)
     # too wide -> small
     elif shape[1] > max_size[1]:
         mat_ls = _fit_wide_matrix(mat_ls, syn_obj, max_size[1])
+    if _is_numpy(matrix):
+        # only the values shown
+        return _native(mat_ls)
     return mat_ls
 
 
@@ -131,9 +231,14 @@ class MathVisitor(ast.NodeVisitor):
         self.mat_size = mat_size
         self.decimal = int(decimal)
         self.dict = working_dict
-        self.s = syntax
+        # the methods of the syntax make the math tree, serialized by render
+        self.s = syntax if isinstance(syntax, StepsSyntax) else math_syntax(syntax)
         self.ital = ital
 
+    def render(self, n) -> str:
+        '''the text of the node in the syntax'''
+        return self.s.serialize(self.visit(n))
+
     def format_name(self, name_str: str) -> str:
         '''
         Turn a variable name into a supported syntax term that has
@@ -194,14 +299,14 @@ class MathVisitor(ast.NodeVisitor):
         return self.visit(n.value)
 
     def visit_Assign(self, n):
-        return self.s.txt('=').join([self.visit(t) for t in n.targets + [n.value]])
+        return self.s.join(self.s.txt('='), [self.visit(t) for t in n.targets + [n.value]])
 
     def visit_Compare(self, n):
         collect = [self.visit(n.left)]
         for i, op in enumerate(n.ops):
             collect.append(self.s.txt(self.visit(op)))
             collect.append(self.visit(n.comparators[i]))
-        return self.s.txt('').join(collect)
+        return self.s.join(self.s.txt(''), collect)
 
     def visit_Eq(self, n):
         return '='
@@ -252,7 +357,7 @@ class MathVisitor(ast.NodeVisitor):
             func = n.func.id
         else:
             func = self.visit(n.func)
-        args = self.s.txt(', ').join([self.visit(arg) for arg in n.args])
+        args = self.s.join(self.s.txt(', '), [self.visit(arg) for arg in n.args])
         ignored = ['round', 'matrix', 'Matrix', 'array', 'ndarray']
         if func == 'sqrt':
             return self.s.rad(args)
@@ -261,22 +366,29 @@ class MathVisitor(ast.NodeVisitor):
         elif func == 'transpose':
             return self.s.sup(args, 'T')
         elif func == 'sum':
-            if isinstance(n.args[0], ast.Name):
-                s_arg = self.visit_Name(n.args[0], True)
-            else:
-                s_arg = n.args[0]
-            if isinstance(s_arg, (ast.List, ast.Tuple)):
-                return self.s.summation(args, len(s_arg.elts))
-            return self.s.greek('Sigma') + self.s.delmtd(args)
+            return self.summation(n, args)
         elif func in ignored:
             return self.visit(n.args[0])
         return self.s.func_name(func) + self.s.delmtd(args)
 
+    def summation(self, n, args):
+        s_arg = n.args[0]
+        if isinstance(s_arg, (ast.List, ast.Tuple)):
+            return self.s.summation(args, len(s_arg.elts))
+        if isinstance(s_arg, ast.Name) and self.subs and s_arg.id in self.dict:
+            # the number of the values, without looking at them
+            value = self.dict[s_arg.id]
+            if _is_numpy(value) and value.ndim:
+                return self.s.summation(args, value.shape[0])
+            if isinstance(value, Iterable) and hasattr(value, '__len__'):
+                return self.s.summation(args, len(value))
+        return self.s.greek('Sigma') + self.s.delmtd(args)
+
     def prec_Call(self, n):
         return 1000
 
     def visit_Lambda(self, n):
-        args = self.s.txt(', ').join([self.format_name(a.arg) for a in n.args.args])
+        args = self.s.join(self.s.txt(', '), [self.format_name(a.arg) for a in n.args.args])
         return self.s.txt('f') + self.s.delmtd(args) + self.s.txt('=') + self.visit(n.body)
 
     def visit_arg(self, n):
@@ -326,16 +438,7 @@ class MathVisitor(ast.NodeVisitor):
     def visit_Constant(self, n):
         kind = type(n.value)
         if kind in [int, float]:
-            if n.value != 0 and (abs(n.value) > 1000 or abs(n.value) < 0.1):
-                # in scientific notation
-                num_ls = (f'%.{self.decimal}E' % n.value).split('E')
-                # remove the preceding zeros and + in the powers like +07 to just 7
-                num_ls[1] = num_ls[1][0].lstrip('+') + num_ls[1][1:].lstrip('0')
-                # make them appear as powers of 10
-                return self.s.txt(num_ls[0]) + self.s.delmtd(self.s.sup(self.s.txt('10'), self.s.txt(num_ls[1])))
-            if n.value == int(n.value):
-                return self.s.txt(str(int(n.value)))
-            return self.s.txt(str(round(n.value, self.decimal)))
+            return format_number(n.value, self.decimal, self.s)
         elif kind == str:
             # if whole string contains only word characters
             if re.match(r'\w*', n.value).span()[1] == len(n.value):
@@ -380,19 +483,22 @@ class MathVisitor(ast.NodeVisitor):
         # to surround with parens if it has units
         if isinstance(n.op, ast.Pow):
             n.left.is_in_power = True
+        tmp_left = self.visit_Name(n.left, True) if isinstance(n.left, ast.Name) else n.left
+        # not forgetting the units, so n.right
+        return self.join_binop(n, self.visit(n.left), self.visit(n.right), tmp_left, tmp_right)
+
+    def join_binop(self, n, left, right, tmp_left, tmp_right):
+        '''
+        join the visited sides of the BinOp, where tmp_left and tmp_right are
+        what they contain underneath, to decide on the parens
+        '''
         # these do not need to be surrounded with parens
         div_and_frac = self.div == 'frac' and isinstance(n.op, ast.Div)
-        tmp_left = self.visit_Name(n.left, True) if isinstance(n.left, ast.Name) else n.left
         if self.prec(n.op) > self.prec(tmp_left) and not div_and_frac:
-            left = self.s.delmtd(self.visit(n.left))
-        else:
-            left = self.visit(n.left)
+            left = self.s.delmtd(left)
         if self.prec(n.op) > self.prec(tmp_right) and \
                 not isinstance(n.op, ast.Pow) and not div_and_frac:
-            # not forgetting the units, so n.right
-            right = self.s.delmtd(self.visit(n.right))
-        else:
-            right = self.visit(n.right)
+            right = self.s.delmtd(right)
         if isinstance(n.op, ast.Mult):
             # unless the right term is a Num or BinOp whose operation is power
             no_need = (not self.mul or self.mul.isspace()) and \
@@ -430,12 +536,12 @@ class MathVisitor(ast.NodeVisitor):
         # if it is used as an index for an iterable, add 1 to the elements if
         # they are numbers
         if hasattr(n, 'is_in_index') and n.is_in_index:
-            return self.s.txt(', ').join([self.s.txt(int(i.n) + 1)
-                                                 if isinstance(i, ast.Constant)
-                                                 else self.visit(i)
-                                                 for i in n.elts])
-        return self.s.delmtd(self.s.txt(', ')
-                             .join([self.visit(element) for element in n.elts]))
+            return self.s.join(self.s.txt(', '), [self.s.txt(int(i.n) + 1)
+                                                  if isinstance(i, ast.Constant)
+                                                  else self.visit(i)
+                                                  for i in n.elts])
+        return self.s.delmtd(self.s.join(self.s.txt(', '),
+                                         [self.visit(element) for element in n.elts]))
 
     def visit_Dict(self, n):  # dict
         def row(k, v):
@@ -466,15 +572,17 @@ class MathVisitor(ast.NodeVisitor):
 
     def visit_Slice(self, n):
         # same thing with adding one
-        lower, upper = [self.s.txt(int(i.n) + 1)
+        lower, upper = [self.s.txt(str(int(i.value) + 1))
                         if isinstance(i, ast.Constant)
+                        # omitted
+                        else self.s.txt('') if i is None
                         else self.visit(i)
                         for i in [n.lower, n.upper]]
         # join the upper and lower limits with -
-        return self.visit(lower) + self.s.txt('-') + self.visit(upper)
+        return lower + self.s.txt('-') + upper
 
     def visit_ExtSlice(self, n):
-        return self.s.txt(', ').join([self.visit(s) for s in n.dims])
+        return self.s.join(self.s.txt(', '), [self.visit(s) for s in n.dims])
 
     def visit_Sub(self, n):
         return self.s.minus
@@ -567,6 +675,143 @@ class MathVisitor(ast.NodeVisitor):
         return 1000
 
 
+class Steps:
+    '''
+    the renderings of an expression as it is (sym) and with the values of the
+    variables substituted (subs), built together in a single traversal
+    '''
+
+    __slots__ = ('sym', 'subs')
+
+    def __init__(self, sym, subs):
+        self.sym = sym
+        self.subs = subs
+
+    @staticmethod
+    def of(rendered):
+        '''the same rendering for both steps'''
+        return rendered if isinstance(rendered, Steps) else Steps(rendered, rendered)
+
+    def __getitem__(self, index):
+        return (self.sym, self.subs)[index]
+
+    def __iter__(self):
+        return iter((self.sym, self.subs))
+
+    def __add__(self, other):
+        other = Steps.of(other)
+        return Steps(self.sym + other.sym, self.subs + other.subs)
+
+    def __radd__(self, other):
+        other = Steps.of(other)
+        return Steps(other.sym + self.sym, other.subs + self.subs)
+
+    def join(self, items):
+        items = [Steps.of(item) for item in items]
+        return Steps(join(self.sym, [item.sym for item in items]),
+                     join(self.subs, [item.subs for item in items]))
+
+
+def _has_steps(arg) -> bool:
+    if isinstance(arg, list):
+        return any(_has_steps(a) for a in arg)
+    return isinstance(arg, Steps)
+
+
+def _step_of(arg, index: int):
+    if isinstance(arg, list):
+        return [_step_of(a, index) for a in arg]
+    return arg[index] if isinstance(arg, Steps) else arg
+
+
+class StepsSyntax:
+    '''
+    wraps a syntax object so that its methods build the renderings of each
+    step of the Steps they are given
+    '''
+
+    def __init__(self, syntax):
+        self.syntax = syntax
+
+    def __getattr__(self, name):
+        attr = getattr(self.syntax, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args):
+            if not any(_has_steps(a) for a in args):
+                return Steps.of(attr(*args))
+            return Steps(attr(*[_step_of(a, 0) for a in args]),
+                         attr(*[_step_of(a, 1) for a in args]))
+        # not to make it again
+        setattr(self, name, method)
+        return method
+
+
+class StepsVisitor(MathVisitor):
+    '''
+    render the expression as it is and with the values substituted in a
+    single traversal, returning Steps. substituted tells whether any value
+    was substituted, otherwise the steps are the same.
+    '''
+
+    def __init__(self, mul, div, mat_size, decimal=3, working_dict={}, syntax=None, ital=True):
+        super().__init__(mul, div, True, mat_size, decimal, working_dict, StepsSyntax(math_syntax(syntax)), ital)
+        # for the parts that differ between the steps
+        self.visitors = [MathVisitor(mul, div, subs, mat_size, decimal, working_dict, syntax, ital)
+                         for subs in (False, True)]
+        self.substituted = False
+
+    def render(self, n) -> Steps:
+        # the syntax wrapped by StepsSyntax
+        return Steps(*[self.s.syntax.serialize(step) for step in Steps.of(self.visit(n))])
+
+    def visit_Attribute(self, n):
+        self.substituted = True
+        return Steps(*[v.visit_Attribute(n) for v in self.visitors])
+
+    def visit_Name(self, n):
+        if n.id in self.dict and str(self.dict[n.id]) != n.id \
+                and not any([operators[op] in n.id for op in operators]):
+            self.substituted = True
+        return Steps(*[v.visit_Name(n) for v in self.visitors])
+
+    def summation(self, n, args):
+        args = Steps.of(args)
+        return Steps(*[v.summation(n, args[i]) for i, v in enumerate(self.visitors)])
+
+    def visit_BinOp(self, n):
+        tmp_right = [n.right, n.right]
+        if isinstance(n.right, ast.Name):
+            tmp_right[1] = self.visitors[1].visit_Name(n.right, True)
+        elif isinstance(n.right, ast.Attribute):
+            tmp_right[1] = self.visitors[1].visit_Attribute(n.right, True)
+        if isinstance(n.op, ast.Pow):
+            n.left.is_in_power = True
+        if isinstance(n.left, ast.Name):
+            tmp_left = [v.visit_Name(n.left, True) for v in self.visitors]
+        else:
+            tmp_left = [n.left, n.left]
+        left, right = Steps.of(self.visit(n.left)), Steps.of(self.visit(n.right))
+        return Steps(*[v.join_binop(n, left[i], right[i], tmp_left[i], tmp_right[i])
+                       for i, v in enumerate(self.visitors)])
+
+
+def find_name_targets(target) -> list[str]:
+    targets = []
+    if type(target) is ast.Tuple or type(target) is ast.List:
+        for elem in target.elts:
+            targets += find_name_targets(elem)
+    elif type(target) is ast.Name:
+        targets.append(target.id)
+    elif isinstance(target, ast.Starred):
+        targets += find_name_targets(target.value)
+    else:
+        # probably not useful to put in document
+        pass
+    return targets
+
+
 def to_math(expr, mul=' ', div='frac', subs=False, mat_size=DEFAULT_MAT_SIZE, decimal=3, working_dict={}, syntax=None, ital=True):
     '''
     return the representation of the expr in the appropriate syntax
@@ -581,7 +826,7 @@ def to_math(expr, mul=' ', div='frac', subs=False, mat_size=DEFAULT_MAT_SIZE, de
     else:
         pt = _prep4lx(expr, syntax, mat_size)
 
-    return MathVisitor(mul, div, subs, mat_size, decimal, working_dict, syntax, ital).visit(pt)
+    return MathVisitor(mul, div, subs, mat_size, decimal, working_dict, syntax, ital).render(pt)
 
 
 def build_eqn(eq_list, disp=True, vert=True, syntax=None, srnd=True, joint='='):
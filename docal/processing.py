@@ -12,14 +12,18 @@ import re
 # for path manips
 # for status tracking
 import logging
+import threading
+from copy import copy
+from dataclasses import dataclass
+from types import FunctionType, CodeType, ModuleType
 from typing import Iterable
-from .calculation import cal, _process_options
-from .parsing import UNIT_PF, eqn, mat_to_list, to_math, build_eqn, _get_parts, Comment
+from .calculation import cal_all, _process_options, set_unit, del_unit, unit_registry, UnitHandler, UnitRegistry, UNITS_NAME
+from .caching import ResultCache, DEFAULT_CACHE_SIZE, digest, _code_names
+from .sweeping import sweep as _sweep, overridden_name
+from .profiling import Profile, record, stage
+from .parsing import UNIT_PF, eqn, format_table, to_math, build_eqn, find_name_targets, _get_parts, _split, Comment
 from .document import Tag
 
-# default working area
-DICT = {}
-
 # the tag pattern
 PATTERN = re.compile(r'(?s)([^\w\\]|^)#(\w+?)(\W|$)')
 
@@ -27,27 +31,154 @@ LOG_FORMAT = '%(levelname)s: %(message)s'
 logging.basicConfig(format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-def find_name_targets(target) -> list[str]:
-    targets = []
-    if type(target) is ast.Tuple or type(target) is ast.List:
-        for elem in target.elts:
-            targets += find_name_targets(elem)
-    elif type(target) is ast.Name:
-        targets.append(target.id)
-    elif isinstance(target, ast.Starred):
-        targets += find_name_targets(target.value)
+def find_read_names(part) -> set[str]:
+    '''the names a statement reads, with the unit entries of those names'''
+    nodes = [part]
+    if isinstance(part, (ast.Assign, ast.Expr)) and part.options:
+        # the result override option is evaluated too
+        for option in _split(part.options, ','):
+            if option.startswith('='):
+                try:
+                    nodes.append(ast.parse(option[1:]))
+                except SyntaxError:
+                    pass
+    reads = set()
+    for node in nodes:
+        for n in ast.walk(node):
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load):
+                reads.add(n.id)
+            elif isinstance(n, ast.AugAssign):
+                reads.update(find_name_targets(n.target))
+    return reads | {name + UNIT_PF for name in reads}
+
+
+def _script_codes(value, working_dict: dict) -> list[CodeType]:
+    '''the code of the value if it is a function or class defined in the script'''
+    if isinstance(value, type):
+        functions = [getattr(attr, '__func__', attr) for attr in vars(value).values()]
     else:
-        # probably not useful to put in document
-        pass
-    return targets
+        functions = [value]
+    return [function.__code__ for function in functions
+            if isinstance(function, FunctionType) and function.__globals__ is working_dict]
+
+
+def find_global_reads(names: set[str], working_dict: dict) -> set[str]:
+    '''
+    the names with the globals read by the functions defined in the script
+    among them, and by the functions those read, as their values depend on
+    them when called
+    '''
+    reads = set(names)
+    pending = list(names)
+    while pending:
+        for code in _script_codes(working_dict.get(pending.pop()), working_dict):
+            for name in _code_names(code) - reads:
+                reads.add(name)
+                pending.append(name)
+    return reads
+
+
+def find_module_attributes(part, working_dict: dict) -> dict:
+    '''the attributes of the modules the statement reads, by their dotted names'''
+    attributes = {}
+    for n in ast.walk(part):
+        if not isinstance(n, ast.Attribute):
+            continue
+        chain = []
+        while isinstance(n, ast.Attribute):
+            chain.insert(0, n.attr)
+            n = n.value
+        if not isinstance(n, ast.Name):
+            continue
+        name, value = n.id, working_dict.get(n.id)
+        for attr in chain:
+            if not isinstance(value, ModuleType) or not hasattr(value, attr):
+                break
+            name, value = f'{name}.{attr}', getattr(value, attr)
+            attributes[name] = value
+    return attributes
+
+
+def find_bound_names(part) -> set[str] | None:
+    '''the names a statement (re)binds or mutates, with their unit entries.
+    None if they cannot be known before executing it (star imports)'''
+    binds = set()
+    for n in ast.walk(part):
+        if isinstance(n, ast.Name) and isinstance(n.ctx, (ast.Store, ast.Del)):
+            binds.add(n.id)
+        elif isinstance(n, (ast.Attribute, ast.Subscript)) \
+                and isinstance(n.ctx, (ast.Store, ast.Del)):
+            # the object is modified in place, like a rebinding
+            base = n.value
+            while isinstance(base, (ast.Attribute, ast.Subscript)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                binds.add(base.id)
+        elif isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            binds.add(n.name)
+        elif isinstance(n, (ast.Import, ast.ImportFrom)):
+            for alias in n.names:
+                if alias.name == '*':
+                    return None
+                binds.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(n, (ast.Global, ast.Nonlocal)):
+            binds.update(n.names)
+    return binds | {name + UNIT_PF for name in binds}
+
+
+def _same_value(old, new) -> bool:
+    '''whether a re-bound value is the same as the previous one, so that
+    the statements that read it need not be processed again'''
+    if old is new:
+        return True
+    if type(old) is not type(new):
+        return False
+    if isinstance(old, ast.AST):
+        return ast.dump(old) == ast.dump(new)
+    try:
+        return bool(old == new)
+    except Exception:
+        # like numpy arrays, ambiguous
+        return False
+
+
+# the name of the overridden values in the working dict
+CASE_NAME = '__DOCAL_CASE__'
+
+# a value for names that are not bound
+_UNBOUND = object()
+
+
+def _kind(part) -> str:
+    '''the kind of the part, for profiles'''
+    if isinstance(part, Comment):
+        return part.kind or 'comment'
+    if isinstance(part, (ast.Assign, ast.Expr)):
+        return 'assignment'
+    return 'statement'
+
+
+@dataclass
+class Statement:
+    '''what is needed to reuse a statement processed in a previous run'''
+    # the values of the names it read, when it was processed
+    inputs: dict
+    # the values of the names it bound, after it was processed
+    outputs: dict
+    # what was rendered from it, for each syntax rendered to
+    rendered: list[list]
+
 
 class LogRecorder(logging.Handler):
+    '''records the messages logged from the thread it was created in'''
     def __init__(self):
         super().__init__()
         self.log = []
+        self.thread = threading.get_ident()
 
     def emit(self, record):
-        self.log.append(self.format(record))
+        if record.thread == self.thread:
+            self.log.append(self.format(record))
 
 
 class processor:
@@ -56,9 +187,33 @@ class processor:
     giving them the dictionary
 
     syntax: an object with methods for math rendering like frac, rad...
+    incremental: when the processor is run again, only process the
+        statements whose source or the values they read have changed since
+        the previous run, reusing the others. The globals read by the
+        functions defined in the script count as read by the statements that
+        call them. Statements are assumed to have no effects other than
+        binding names.
+    cache_dir: a directory to store the values and renderings of the
+        assignments in, to be reused by later runs if the statement, its
+        options and the values it reads are the same.
+    cache_size: the maximum total size of the cache directory in bytes
+    namespace: the initial variables of the working area. Each processor
+        has its own copy, so they do not affect each other.
+    overrides: values to use for variables instead of the ones assigned to
+        them, like the inputs of one case of a sweep. Only assignments to
+        single names are overridden.
+    profile: record the time spent in each stage of processing each part
+        in self.profile (see profiling.Profile)
+
+    To render the same run with other syntaxes, for other documents, get a
+    processor for each with render_to before running it. They are filled
+    with what is rendered for them in their contents as the content is
+    processed, which is evaluated only once.
     '''
 
-    def __init__(self, syntax=None, tags: list[Tag] | None=None, log_level=None):
+    def __init__(self, syntax=None, tags: list[Tag] | None=None, log_level=None, incremental=False,
+                 cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, namespace: dict | None=None,
+                 overrides: dict | None=None, profile=False):
         '''initialize'''
 
         self.syntax = syntax
@@ -69,12 +224,44 @@ class processor:
         self.log = []
         self.log_recorder = LogRecorder()
         self.log_recorder.setFormatter(log_formatter)
-        # to avoid repeatedly adding the same handler
-        logger.handlers = []
+        # to avoid repeatedly adding the same handler, only replacing the
+        # one of this thread as others may be running in other threads
+        for handler in logger.handlers[:]:
+            if isinstance(handler, LogRecorder) and handler.thread == self.log_recorder.thread:
+                logger.removeHandler(handler)
         logger.addHandler(self.log_recorder)
         if log_level:
             logger.setLevel(getattr(logging, log_level.upper()))
         # =========TAG HANDLING================
+        self._set_tags(tags)
+        # =========CALCULATION================
+        # the calculations corresponding to the tags
+        self.contents = {}
+        # working area, only for this processor
+        self.namespace = dict(namespace) if namespace else {}
+        self.overrides = dict(overrides) if overrides else {}
+        self.working_dict = {**self.namespace, **self.overrides}
+        self.working_dict[CASE_NAME] = self.overrides
+        # default calculation options
+        self.default_options = _process_options('', syntax=self.syntax)
+        self.working_dict['__DOCAL_OPTIONS__'] = self.default_options
+        # the units in use, its own even if the namespace has one
+        self.working_dict[UNITS_NAME] = UnitRegistry.of(self.working_dict)
+        # the source of the current default options, for incremental runs
+        self.default_options_src = ''
+        # =========INCREMENTAL================
+        self.incremental = incremental
+        # the statements processed in the previous run, by their source
+        self.statements: dict[tuple, Statement] = {}
+        # =========CACHE================
+        self.cache = ResultCache(cache_dir, cache_size) if cache_dir else None
+        # =========PROFILING================
+        self.profile = Profile() if profile else None
+        # =========OTHER SYNTAXES================
+        self.renderers: list[processor] = []
+
+    def _set_tags(self, tags: list[Tag] | None):
+        '''take the tags of the document, starting with the first block tag'''
         self.current_tag = None
         if tags:
             self.tags = tags
@@ -91,26 +278,98 @@ class processor:
             self.tags = None
             if tags is not None:
                 logger.warning('There are no tags in the document')
-        # =========CALCULATION================
-        # the calculations corresponding to the tags
-        self.contents = {}
-        # working area
-        self.working_dict = DICT
-        # default calculation options
-        self.default_options = _process_options('', syntax=self.syntax)
-        self.working_dict['__DOCAL_OPTIONS__'] = self.default_options
+
+    def render_to(self, syntax, tags: list[Tag] | None=None) -> 'processor':
+        '''
+        a processor whose contents are filled with what this one renders,
+        rendered with the syntax and for the tags of another document,
+        without evaluating the content again
+        '''
+        renderer = copy(self)
+        renderer.syntax = syntax
+        renderer.default_options = _process_options(self.default_options_src, syntax=syntax)
+        renderer._set_tags(tags)
+        renderer.contents = {}
+        renderer.renderers = []
+        self.renderers.append(renderer)
+        return renderer
+
+    def _add(self, processed: list):
+        '''add the rendered parts with their tags to the contents'''
+        for tag, part in processed:
+            if tag not in self.contents:
+                self.contents[tag] = []
+            self.contents[tag].append(part)
 
     def send(self, content):
         '''add the content to the tag, which will be sent to the document.
         Where it will be inserted is decided by the most recent tag.'''
 
-        for tag, part in self.process(content):
-            if tag not in self.contents.keys():
-                self.contents[tag] = []
-            self.contents[tag].append(part)
+        self._add(self.stream(content))
+
+    def sweep(self, content, cases, table: str | None=None, columns: list[str] | None=None,
+              workers: int | None=None) -> dict[str, list]:
+        '''
+        evaluate the content for each case of the values of some variables,
+        without rendering it, starting from the namespace each time.
+
+        cases: the name of a CSV file with the names of the variables in the
+            first row and their values for a case in each of the others, or
+            a dict of the names and their values (lists or numpy arrays)
+        table: a name to store the results in as a table, with the names of
+            the columns in the first row, so that a table tag of that name
+            is filled with it when the content is sent
+        columns: the variables to collect, the ones in the cases and those
+            assigned in the content by default
+        workers: the number of worker processes to use if the cases cannot
+            be evaluated at once with numpy arrays
+
+        returns the values of the columns for each case
+        '''
+        results = _sweep(content, cases, self.namespace, columns, workers)
+        if table is not None:
+            self.working_dict[table] = [list(results)] + [list(row) for row in zip(*results.values())]
+        return results
 
     def process(self, parts): # exported
-        processed = []
+        return list(self.stream(parts))
+
+    def stream(self, parts): # exported
+        '''
+        process the parts, yielding the rendered ones with their tags as they
+        are rendered so that they need not all be kept. The ones rendered for
+        the renderers (see render_to) are added to their contents.
+        '''
+        targets = [self, *self.renderers]
+        tag_sets = [target._tag_sets() for target in targets]
+        # to tell apart the repetitions of the same statement
+        occurrences: dict[tuple, int] = {}
+        statements: dict[tuple, Statement] = {}
+        for part in _get_parts(parts):
+            with record(self.profile, part.lineno, _kind(part)):
+                if isinstance(part, Comment):
+                    processed = [target._process_comment(part, tag_names)
+                                 for target, (tag_names, _) in zip(targets, tag_sets)]
+                else:
+                    rendered = self._process_statement(part, occurrences, statements)
+                    processed = [[(target.current_tag, proced) for proced in target_rendered]
+                                 for target, target_rendered in zip(targets, rendered)]
+            for renderer, renderer_processed in zip(self.renderers, processed[1:]):
+                renderer._add(renderer_processed)
+            yield from processed[0]
+        # only keep the statements of this run for the next one
+        self.statements = statements
+        for target, (_, variable_tags) in zip(targets, tag_sets):
+            for tag in variable_tags.values():
+                with record(self.profile, None, '#' + tag.name), stage('render'):
+                    processed = target._process_variable_tag(tag)
+                if target is self:
+                    yield from processed
+                else:
+                    target._add(processed)
+
+    def _tag_sets(self) -> tuple[set[str], dict[str, Tag]]:
+        '''the names of the block tags, and the tags filled with variables'''
         tag_names = set()
         variable_tags: dict[str, Tag] = {}
         if self.tags is not None:
@@ -119,58 +378,41 @@ class processor:
                     variable_tags[tag.name] = tag
                 else:
                     tag_names.add(tag.name)
-        for part in _get_parts(parts):
-            if isinstance(part, Comment):
-                if part.kind == 'tag':
-                    self.current_tag = part.content
-                    logger.info('[Change tag] #%s', self.current_tag)
-                    if self.tags and self.current_tag not in tag_names:
-                        logger.warning('#' + self.current_tag + ' is not in the tags')
-                elif part.kind == 'text':
-                    for line in self._process_text(part.content):
-                        processed.append((self.current_tag, line))
-                elif part.kind in ['eqn-inline', 'eqn-disp']:
-                    disp = part.kind == 'eqn-disp'
-                    processed.append((self.current_tag, self._process_equation(part.content, disp)))
-                elif part.kind == 'options':
-                    # set options for calculations that follow
-                    self.default_options = _process_options(part.content, syntax=self.syntax)
-            elif isinstance(part, (ast.Assign, ast.Expr)):
-                for proced in self._process_assignment(part):
-                    processed.append((self.current_tag, proced))
-            else:
-                # if it does not appear like an equation or a comment,
-                # just execute it
-                logger.info('[Executing] line %s', part.lineno)
-                co = compile(ast.Module([part], []), '<calculation>', 'exec')
-                exec(co, self.working_dict)
-                if isinstance(part, ast.Delete):
-                    # also delete associated unit strings
-                    for t in part.targets:
-                        unit_var = t.id + UNIT_PF
-                        if unit_var in self.working_dict:
-                            del self.working_dict[unit_var]
-        for tag in variable_tags.values():
-            if not tag.table:
-                processed.append((tag.name, ('inline', self._format_value(tag.name))))
-                continue
-            if tag.name not in self.working_dict:
-                raise KeyError(f"'{tag.name}' is an undefined variable.")
-            value = self.working_dict[tag.name]
-            if not isinstance(value, Iterable):
-                continue
-            tbl_value = []
-            for row in mat_to_list(value):
-                if not isinstance(row, Iterable):
-                    continue
-                row_val = []
-                for col in row:
-                    row_val.append(self._format_value(tag.name, value=col))
-                tbl_value.append(row_val)
-            processed.append((tag.name, ('table', tbl_value)))
+        return tag_names, variable_tags
 
+    def _process_comment(self, part: Comment, tag_names: set[str]) -> list:
+        '''process a comment part of the content, returning the rendered by tag'''
+        processed = []
+        if part.kind == 'tag':
+            self.current_tag = part.content
+            logger.info('[Change tag] #%s', self.current_tag)
+            if self.tags and self.current_tag not in tag_names:
+                logger.warning('#' + self.current_tag + ' is not in the tags')
+        elif part.kind == 'text':
+            with stage('render'):
+                for line in self._process_text(part.content):
+                    processed.append((self.current_tag, line))
+        elif part.kind in ['eqn-inline', 'eqn-disp']:
+            disp = part.kind == 'eqn-disp'
+            with stage('render'):
+                processed.append((self.current_tag, self._process_equation(part.content, disp)))
+        elif part.kind == 'options':
+            # set options for calculations that follow
+            self.default_options = _process_options(part.content, syntax=self.syntax)
+            self.default_options_src = part.content
         return processed
 
+    def _process_variable_tag(self, tag: Tag) -> list:
+        '''the value of the variable to fill the tag with'''
+        if not tag.table:
+            return [(tag.name, ('inline', self._format_value(tag.name)))]
+        if tag.name not in self.working_dict:
+            raise KeyError(f"'{tag.name}' is an undefined variable.")
+        value = self.working_dict[tag.name]
+        if not isinstance(value, Iterable):
+            return []
+        return [(tag.name, ('table', format_table(value, self.default_options['decimal'], syntax=self.syntax)))]
+
     def _format_value(self, var, srnd=True, value=None):
         if var not in self.working_dict:
             raise KeyError(f"'{var}' is an undefined variable.")
@@ -186,7 +428,7 @@ class processor:
                 and self.working_dict[unit_name] != '_' else ''
         else:
             unit = ''
-        result = to_math(value, syntax=self.syntax)
+        result = to_math(value, decimal=self.default_options['decimal'], syntax=self.syntax)
         return build_eqn([[result + self.syntax.txt(self.syntax.halfsp) + unit]],
                          disp=False, vert=False, srnd=srnd,
                          syntax=self.syntax)
@@ -230,16 +472,150 @@ class processor:
             equation = (equation[0], equation[1].replace(to_math(pholder, syntax=self.syntax), v, 1))
         return equation
 
+    def _process_statement(self, part, occurrences: dict[tuple, int], statements: dict[tuple, Statement]) -> list[list]:
+        '''
+        process the statement, or reuse the result of the previous run if
+        nothing it depends on has changed. Returns what is rendered from it
+        with the syntax of this processor and of each renderer
+        '''
+        if not self.incremental:
+            return self._execute(part)
+        source = (ast.dump(part), getattr(part, 'options', None), self.default_options_src)
+        occurrences[source] = occurrences.get(source, 0) + 1
+        key = (*source, occurrences[source])
+        previous = self.statements.get(key)
+        if previous is not None and len(previous.rendered) == len(self.renderers) + 1 and all(
+                self.working_dict.get(name, _UNBOUND) is value
+                for name, value in previous.inputs.items()):
+            logger.info('[Unchanged] line %s', part.lineno)
+            for name, value in previous.outputs.items():
+                self._bind(name, value)
+            statements[key] = previous
+            return previous.rendered
+        inputs = {name: self.working_dict.get(name, _UNBOUND)
+                  for name in find_global_reads(find_read_names(part), self.working_dict)}
+        rendered = self._execute(part)
+        binds = find_bound_names(part)
+        if binds is None:
+            # cannot be reused, always processed
+            return rendered
+        outputs = {}
+        for name in binds:
+            value = self.working_dict.get(name, _UNBOUND)
+            if previous is not None and name in previous.outputs \
+                    and _same_value(previous.outputs[name], value):
+                # keep the previous object so that the dependents are unchanged
+                value = previous.outputs[name]
+                self._bind(name, value)
+            outputs[name] = value
+        statements[key] = Statement(inputs, outputs, rendered)
+        return rendered
+
+    def _bind(self, name: str, value):
+        '''bind the value of a name in the working dict, or unbind it'''
+        if name.endswith(UNIT_PF):
+            if value is _UNBOUND:
+                del_unit(self.working_dict, name[:-len(UNIT_PF)])
+            else:
+                set_unit(self.working_dict, name[:-len(UNIT_PF)], value)
+        elif value is _UNBOUND:
+            self.working_dict.pop(name, None)
+        else:
+            self.working_dict[name] = value
+
+    def _execute(self, part) -> list[list]:
+        '''process a statement and return what is rendered from it for each syntax'''
+        if isinstance(part, (ast.Assign, ast.Expr)):
+            return self._process_assignment(part)
+        # if it does not appear like an equation or a comment,
+        # just execute it
+        logger.info('[Executing] line %s', part.lineno)
+        with stage('eval'):
+            co = compile(ast.Module([part], []), '<calculation>', 'exec')
+            exec(co, self.working_dict)
+        if isinstance(part, ast.Delete):
+            # also delete associated unit strings
+            for t in part.targets:
+                if isinstance(t, ast.Name):
+                    del_unit(self.working_dict, t.id)
+        return [[] for _ in range(len(self.renderers) + 1)]
+
     def _process_assignment(self, line):
         '''
-        evaluate assignments and convert to latex form
+        evaluate assignments and convert to latex form, with the syntax of
+        this processor and of each renderer
         '''
         logger.info('[Processing] line %s', line.lineno)
         # the cal function will execute it so no need for exec
         options = _process_options(line.options, self.default_options, self.syntax)
-        result = cal(line,
-                     self.working_dict,
-                     syntax=self.syntax,
-                     options=options)
-        return [result] + [('text', '')] * options['newlines']
+        name = overridden_name(line, self.overrides)
+        if name is not None:
+            options['result'] = ast.parse(f'{CASE_NAME}[{name!r}]', mode='eval').body
+        syntaxes = [self.syntax] + [renderer.syntax for renderer in self.renderers]
+        # for each syntax, the renderings are stored separately
+        keys = [self._cache_key(line, options, syntax) for syntax in syntaxes] \
+            if self.cache is not None else [None]
+        cached = [self.cache.get(key) for key in keys] if None not in keys else [None]
+        if None not in cached:
+            logger.info('[Cached] line %s', line.lineno)
+            results = [result for _, result in cached]
+            for name, value in cached[0][0].items():
+                self._bind(name, value)
+        else:
+            results = cal_all(line,
+                              self.working_dict,
+                              syntaxes,
+                              options=options)
+            if None not in keys:
+                values = {}
+                for target in line.targets:
+                    for name in find_name_targets(target):
+                        values[name] = self.working_dict[name]
+                        values[name + UNIT_PF] = self.working_dict[name + UNIT_PF]
+                for key, result in zip(keys, results):
+                    self.cache.put(key, (values, result))
+        return [[result] + [('text', '')] * options['newlines'] for result in results]
+
+    def _cache_key(self, line, options, syntax) -> str | None:
+        '''
+        the key of the assignment in the cache, from everything its result
+        depends on. None if it cannot be cached
+        '''
+        if not isinstance(line, ast.Assign):
+            return None
+        for target in line.targets:
+            for n in ast.walk(target):
+                # other targets modify existing objects
+                if not isinstance(n, (ast.Name, ast.Tuple, ast.List, ast.Starred, ast.Store)):
+                    return None
+        syntax = type(syntax)
+        parts = [ast.dump(line), line.options, self.default_options_src,
+                 f'{syntax.__module__}.{syntax.__qualname__}']
+        name = overridden_name(line, self.overrides)
+        if name is not None:
+            value_digest = digest(self.overrides[name])
+            if value_digest is None:
+                return None
+            parts.append(f'={value_digest}')
+        # with the globals the functions defined in the script read
+        for name in sorted(find_global_reads(find_read_names(line), self.working_dict)):
+            if name not in self.working_dict:
+                continue
+            value_digest = digest(self.working_dict[name])
+            if value_digest is None:
+                return None
+            parts.append(f'{name}={value_digest}')
+        # the modules are hashed with their files, their attributes for the
+        # functions from elsewhere they reach
+        for name, value in sorted(find_module_attributes(line, self.working_dict).items()):
+            value_digest = digest(value)
+            if value_digest is None:
+                return None
+            parts.append(f'{name}={value_digest}')
+        if options['unit'] is None:
+            # the unit will be chosen from the ones in use
+            unit = UnitHandler(False, self.working_dict).visit(line.value)
+            unit = unit_registry(self.working_dict).find(unit)
+            parts.append(ast.dump(unit) if unit is not None else '')
+        return ResultCache.key(*parts)
 
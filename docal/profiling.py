@@ -0,0 +1,99 @@
+'''
+module profiling
+
+records the time spent in each stage of processing each part of a script,
+to find the lines that make a report slow
+'''
+
+import json
+from time import perf_counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# the stages whose times are recorded for each part
+STAGES = ['eval', 'units', 'render', 'write']
+
+# the profile recording in the current context, if any
+_current: ContextVar['Profile | None'] = ContextVar('docal_profile', default=None)
+
+_no_profile = nullcontext()
+
+
+class Profile:
+    '''
+    the times of the stages of the parts, each part with its line number
+    (None for those not from a line, like the tags filled with values) and
+    its kind. The time of a stage excludes those of the stages inside it.
+    '''
+
+    def __init__(self):
+        self.entries: list[dict] = []
+        # the entry of the part being processed
+        self.entry: dict | None = None
+        # the times of the stages inside the running ones
+        self.nested: list[float] = []
+
+    @contextmanager
+    def part(self, lineno: int | None, kind: str):
+        '''record the times of the stages in the block for the part'''
+        entry = {'line': lineno, 'kind': kind, 'total': 0.0, **dict.fromkeys(STAGES, 0.0)}
+        self.entries.append(entry)
+        prev_entry = self.entry
+        self.entry = entry
+        token = _current.set(self)
+        start = perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['total'] = perf_counter() - start
+            _current.reset(token)
+            self.entry = prev_entry
+
+    @contextmanager
+    def stage(self, name: str):
+        '''add the time of the block to the stage of the current part'''
+        entry = self.entry
+        self.nested.append(0.0)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            entry[name] += elapsed - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    def totals(self) -> dict:
+        '''the total time of each stage and of all the parts'''
+        return {key: sum(entry[key] for entry in self.entries)
+                for key in ['total', *STAGES]}
+
+    def to_json(self) -> str:
+        return json.dumps({'parts': self.entries, 'totals': self.totals()}, indent=2)
+
+    def summary(self, top: int | None = None) -> str:
+        '''a table of the parts, the slowest first'''
+        entries = sorted(self.entries, key=lambda e: e['total'], reverse=True)[:top]
+        lines = [f'{"line":>6}  {"kind":<12}' + ''.join(f'{key:>10}' for key in ['total', *STAGES])]
+        for entry in entries:
+            line = '-' if entry['line'] is None else entry['line']
+            lines.append(f'{line:>6}  {entry["kind"]:<12}'
+                         + ''.join(f'{entry[key]:>10.4f}' for key in ['total', *STAGES]))
+        totals = self.totals()
+        lines.append(f'{"":>6}  {"all":<12}' + ''.join(f'{totals[key]:>10.4f}' for key in ['total', *STAGES]))
+        return '\n'.join(lines)
+
+
+def record(profile: Profile | None, lineno: int | None, kind: str):
+    '''record the part in the profile, if there is one'''
+    if profile is None:
+        return _no_profile
+    return profile.part(lineno, kind)
+
+
+def stage(name: str):
+    '''record the time of the block as the stage of the part being recorded'''
+    profile = _current.get()
+    if profile is None or profile.entry is None:
+        return _no_profile
+    return profile.stage(name)
@@ -0,0 +1,235 @@
+'''
+the large parts of the math kept as a tree of the calls of the methods of the
+syntax, and its serialization in one pass, so that they are not copied into
+every form that contains them. the tree is made for a single syntax
+'''
+
+import re
+from weakref import WeakKeyDictionary
+
+# the placeholders of the arguments given to the methods of the syntax listed
+# in its template_forms, which only place their arguments in the text, to make
+# the templates
+SLOT = '\0{}\0'
+SLOT_PATTERN = re.compile('\0(\\d+)\0')
+
+# the templates of the forms, by the class of the syntax
+TEMPLATES: dict[type, dict] = {}
+# the forms that are given only text
+TEXTS = {'txt', 'txt_rom', 'txt_math', 'greek'}
+# the size of the text below which the forms are made into text right away,
+# copying it costs less than making a node
+SMALL_SIZE = 1 << 15
+
+
+class Math:
+    '''
+    a node of the math tree: the call of the method of the syntax named form
+    with args, or the concatenation of args if form is None
+    '''
+
+    __slots__ = ('form', 'args')
+
+    def __init__(self, form, args):
+        self.form = form
+        self.args = args
+
+    def __add__(self, other):
+        return Math(None, (self, other))
+
+    def __radd__(self, other):
+        return Math(None, (other, self))
+
+
+def join(sep, items):
+    '''sep.join(items) for the texts and the nodes'''
+    items = list(items)
+    if type(sep) is str:
+        try:
+            return sep.join(items)
+        except TypeError:  # some are nodes
+            pass
+    joined = []
+    for item in items:
+        joined += [sep, item]
+    return Math(None, tuple(joined[1:]))
+
+
+def _shape(arg):
+    '''the part of the arguments that decides the template'''
+    kind = type(arg)
+    if kind is str or kind is Math:
+        return None
+    if kind is list:
+        return tuple(_shape(a) for a in arg)
+    # the others are given to the syntax as they are
+    return (kind, arg)
+
+
+class MathSyntax:
+    '''
+    wraps a syntax object so that its methods build the math tree, which is
+    then serialized at once with serialize
+    '''
+
+    def __init__(self, syntax):
+        self.syntax = syntax
+        self.templates = TEMPLATES.setdefault(type(syntax), {})
+
+    def __getattr__(self, name):
+        attr = getattr(self.syntax, name)
+        # the texts are not made of other forms
+        if not callable(attr) or name in TEXTS:
+            setattr(self, name, attr)
+            return attr
+
+        def method(*args):
+            for arg in args:
+                kind = type(arg)
+                if kind is str:
+                    if len(arg) > SMALL_SIZE:
+                        return Math(name, args)
+                elif kind is not int and (kind is not list or _size(arg) > SMALL_SIZE):
+                    return Math(name, args)
+            return attr(*args)
+        # not to make it again
+        setattr(self, name, method)
+        return method
+
+    def join(self, sep, items):
+        return join(sep, items)
+
+    def _template(self, form: str, args: tuple):
+        '''
+        the text of the form with the places of the arguments, None if the
+        form has to be called with the text of the arguments
+        '''
+        # the others may look at or change the text of their arguments
+        if not _templated(type(self.syntax), form):
+            return None
+        slots = []
+
+        def probe(arg):
+            kind = type(arg)
+            if kind is str or kind is Math:
+                slots.append(arg)
+                return SLOT.format(len(slots) - 1)
+            if kind is list:
+                return [probe(a) for a in arg]
+            return arg
+        try:
+            text = getattr(self.syntax, form)(*[probe(a) for a in args])
+        except (KeyError, IndexError, TypeError, ValueError):
+            # it uses the values of the arguments
+            return None
+        parts = SLOT_PATTERN.split(text)
+        # every argument placed once and as it is
+        if sorted(int(p) for p in parts[1::2]) != list(range(len(slots))):
+            return None
+        return tuple(int(p) if i % 2 else p for i, p in enumerate(parts) if i % 2 or p)
+
+    def _text(self, arg):
+        if type(arg) is list:
+            return [self._text(a) for a in arg]
+        if type(arg) is Math:
+            return self.serialize(arg)
+        return arg
+
+    def serialize(self, tree) -> str:
+        '''the text of the math tree'''
+        if type(tree) is str:
+            return tree
+        out = []
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if type(node) is not Math:
+                out.append(node)
+                continue
+            form, args = node.form, node.args
+            if form is None:
+                stack += reversed(args)
+                continue
+            # only the simple arguments make the same template
+            key = form
+            slots = args
+            for arg in args:
+                if type(arg) is not str and type(arg) is not Math:
+                    key = (form, _shape(args))
+                    slots = []
+                    for a in args:
+                        if type(a) is list:
+                            slots += _flatten(a)
+                        elif type(a) is str or type(a) is Math:
+                            slots.append(a)
+                    break
+            try:
+                template = self.templates[key]
+            except KeyError:
+                template = self.templates[key] = self._template(form, args)
+            except TypeError:  # not hashable
+                template = None
+            if template is None:
+                out.append(getattr(self.syntax, form)(*[self._text(a) for a in args]))
+                continue
+            stack += [slots[p] if type(p) is int else p for p in reversed(template)]
+        return ''.join(out)
+
+
+def _templated(kind: type, form: str) -> bool:
+    '''
+    whether the form is in the template_forms of the class that defines it,
+    not of one it overrides
+    '''
+    for cls in kind.__mro__:
+        if form in vars(cls):
+            return form in vars(cls).get('template_forms', ())
+    return False
+
+
+def _size(args: list) -> int:
+    '''the size of the text in the list, too big if it has nodes'''
+    size = 0
+    for arg in args:
+        kind = type(arg)
+        if kind is str:
+            size += len(arg)
+        elif kind is list:
+            size += _size(arg)
+        elif kind is Math:
+            return SMALL_SIZE + 1
+    return size
+
+
+def _flatten(args: list) -> list:
+    flat = []
+    for arg in args:
+        if type(arg) is list:
+            flat += _flatten(arg)
+        elif type(arg) is str or type(arg) is Math:
+            flat.append(arg)
+    return flat
+
+
+_math_syntaxes = WeakKeyDictionary()
+# the last one, mostly the same syntax is used
+_last = (None, None)
+
+
+def math_syntax(syntax) -> MathSyntax:
+    '''the MathSyntax of the syntax object, made once for each'''
+    global _last
+    if type(syntax) is MathSyntax:
+        return syntax
+    # read once, another thread can replace it in between
+    last = _last
+    if last[0] is syntax:
+        return last[1]
+    try:
+        wrapped = _math_syntaxes.get(syntax)
+        if wrapped is None:
+            wrapped = _math_syntaxes[syntax] = MathSyntax(syntax)
+    except TypeError:  # not weakly referable
+        return MathSyntax(syntax)
+    _last = (syntax, wrapped)
+    return wrapped
@@ -0,0 +1,232 @@
+'''
+module sweeping
+
+evaluates a script for many cases of the values of some of its variables,
+all at once with numpy arrays where the script allows it, otherwise case by
+case in a pool of worker processes
+'''
+
+import os
+import ast
+import csv
+import pickle
+import logging
+from collections.abc import Mapping
+from .calculation import _process_options, assign
+from .parsing import Comment, _get_parts, find_name_targets
+
+logger = logging.getLogger(__name__)
+
+# statements that may do different things for different cases, which cannot
+# be evaluated for all of them at once
+CONTROL_FLOW = (ast.For, ast.AsyncFor, ast.While, ast.If, ast.Try, ast.TryStar,
+                ast.With, ast.AsyncWith, ast.Match)
+# the relative difference allowed between the values of a case evaluated
+# with the others and alone, for the different rounding of numpy
+TOLERANCE = 1e-9
+
+
+def _parse_cell(cell: str):
+    '''a number if the cell has one, otherwise the text'''
+    try:
+        return ast.literal_eval(cell.strip())
+    except (ValueError, SyntaxError):
+        return cell
+
+
+def read_cases(cases) -> dict:
+    '''
+    the values of the variables for each case, from a CSV file with the
+    names of the variables in its first row, or a mapping of the names to
+    sequences (or numpy arrays) of values
+    '''
+    if not isinstance(cases, Mapping):
+        with open(cases, newline='', encoding='utf-8') as file:
+            rows = [row for row in csv.reader(file) if row]
+        names = [name.strip() for name in rows[0]]
+        cases = {name: [_parse_cell(row[i]) for row in rows[1:]]
+                 for i, name in enumerate(names)}
+    for name in cases:
+        if not name.isidentifier():
+            raise ValueError(f"'{name}' is not a valid variable name.")
+    if len({len(values) for values in cases.values()}) > 1:
+        raise ValueError('All the variables should have values for the same number of cases.')
+    return dict(cases)
+
+
+def overridden_name(part, overrides: dict) -> str | None:
+    '''
+    the name of the variable if the statement assigns to one whose value is
+    overridden, only for single name targets
+    '''
+    if isinstance(part, ast.Assign) and len(part.targets) == 1 \
+            and isinstance(part.targets[0], ast.Name) and part.targets[0].id in overrides:
+        return part.targets[0].id
+    return None
+
+
+def compile_parts(parts: list) -> list[tuple]:
+    '''
+    the code objects of the statements, compiled once for all the cases,
+    with the assignments and expressions compiled as the expression whose
+    value is used (the result given in the options if given)
+    '''
+    compiled = []
+    for part in parts:
+        if isinstance(part, Comment):
+            continue
+        if isinstance(part, (ast.Assign, ast.Expr)):
+            result = _process_options(part.options)['result']
+            code = compile(ast.Expression(part.value if result is None else result),
+                           '<calculation>', 'eval')
+        else:
+            code = compile(ast.Module([part], []), '<calculation>', 'exec')
+        compiled.append((part, code))
+    return compiled
+
+
+def evaluate(compiled: list[tuple], namespace: dict, overrides: dict) -> dict:
+    '''
+    carry out the compiled statements without rendering them, with the
+    values of the overridden variables used instead of the assigned ones,
+    and return the resulting variables
+    '''
+    working_dict = {**namespace, **overrides}
+    for part, code in compiled:
+        if isinstance(part, (ast.Assign, ast.Expr)):
+            name = overridden_name(part, overrides)
+            value = eval(code, working_dict) if name is None else overrides[name]
+            if isinstance(part, ast.Assign):
+                assign(part, value, working_dict)
+        else:
+            exec(code, working_dict)
+    return working_dict
+
+
+def _assigned_names(parts: list) -> list[str]:
+    names = {}
+    for part in parts:
+        if isinstance(part, ast.Assign):
+            for target in part.targets:
+                names.update(dict.fromkeys(find_name_targets(target)))
+    return list(names)
+
+
+def _columns(working_dict: dict, columns: list[str]) -> list:
+    values = []
+    for name in columns:
+        if name not in working_dict:
+            raise KeyError(f"'{name}' is an undefined variable.")
+        values.append(working_dict[name])
+    return values
+
+
+def _evaluate_at_once(compiled: list[tuple], namespace: dict, cases: dict, columns: list[str], n_cases: int) -> dict | None:
+    '''
+    evaluate all the cases at once, with the overridden variables as numpy
+    arrays. None if the script cannot be evaluated that way, or if the
+    results differ from those of some of the cases evaluated alone, like
+    when it reduces the arrays or has arrays of its own
+    '''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    if any(isinstance(part, CONTROL_FLOW) for part, _ in compiled):
+        return None
+    overrides = {name: numpy.asarray(values) for name, values in cases.items()}
+    if any(values.dtype.kind not in 'biufc' or values.ndim != 1 for values in overrides.values()):
+        # only numbers can be broadcast
+        return None
+    try:
+        # like division by zero, which is an error for a single case
+        with numpy.errstate(all='raise'):
+            working_dict = evaluate(compiled, namespace, overrides)
+    except Exception as exc:
+        logger.info('Cannot evaluate the cases at once (%s), evaluating them one by one...', exc)
+        return None
+    results = {}
+    for name, value in zip(columns, _columns(working_dict, columns)):
+        shape = getattr(value, 'shape', None)
+        if shape == (n_cases,):
+            results[name] = value.tolist()
+        elif shape == ():
+            results[name] = [value.item()] * n_cases
+        elif isinstance(value, (int, float, complex)):
+            results[name] = [value] * n_cases
+        else:
+            # cannot tell the cases apart in the value
+            return None
+    # the first, middle and last cases, to check against
+    for i in sorted({0, n_cases // 2, n_cases - 1}):
+        case = evaluate(compiled, namespace, {name: values[i] for name, values in cases.items()})
+        for name, value in zip(columns, _columns(case, columns)):
+            if not _same_value(numpy, results[name][i], value):
+                logger.info('Cannot evaluate the cases at once (%s differs), evaluating them one by one...', name)
+                return None
+    return results
+
+
+def _same_value(numpy, at_once, alone) -> bool:
+    '''whether the value of a case evaluated at once is the one evaluated alone'''
+    try:
+        return numpy.shape(alone) == () and bool(
+            numpy.isclose(at_once, alone, rtol=TOLERANCE, atol=0, equal_nan=True))
+    except TypeError:
+        return False
+
+
+# what the worker processes need for every case, set once for each
+_worker = {}
+
+
+def _init_worker(script: str, namespace: dict, columns: list[str]):
+    _worker.update(compiled=compile_parts(_get_parts(script)), namespace=namespace, columns=columns)
+
+
+def _evaluate_case(overrides: dict) -> list:
+    working_dict = evaluate(_worker['compiled'], _worker['namespace'], overrides)
+    return _columns(working_dict, _worker['columns'])
+
+
+def _picklable(value) -> bool:
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+    return True
+
+
+def sweep(script: str, cases, namespace: dict | None = None, columns: list[str] | None = None,
+          workers: int | None = None) -> dict[str, list]:
+    '''
+    evaluate the script for each case of the values of the variables in
+    cases (see read_cases), starting from the namespace each time. The value
+    assigned to a variable in the cases is replaced by that of the case.
+    Returns the values of the variables in columns (the ones in the cases
+    and those assigned in the script by default) for each case.
+    '''
+    cases = read_cases(cases)
+    namespace = namespace or {}
+    parts = _get_parts(script)
+    if columns is None:
+        columns = list(dict.fromkeys([*cases, *_assigned_names(parts)]))
+    n_cases = len(next(iter(cases.values()), []))
+    compiled = compile_parts(parts)
+    results = _evaluate_at_once(compiled, namespace, cases, columns, n_cases)
+    if results is not None:
+        return results
+    case_overrides = [{name: values[i] for name, values in cases.items()}
+                      for i in range(n_cases)]
+    if workers != 1 and n_cases > 1 and _picklable(namespace):
+        # only when needed, it takes long to import
+        from concurrent.futures import ProcessPoolExecutor
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(script, namespace, columns)) as pool:
+            rows = list(pool.map(_evaluate_case, case_overrides,
+                                 chunksize=max(1, n_cases // (workers * 4))))
+    else:
+        rows = [_columns(evaluate(compiled, namespace, overrides), columns)
+                for overrides in case_overrides]
+    return {name: [row[i] for row in rows] for i, name in enumerate(columns)}
@@ -0,0 +1,464 @@
+import re
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from docal import processor
+from docal.document.latex import syntax as syn_t, document as doc_t
+
+script = '''
+calls = []
+def f(v):
+    calls.append(v)
+    return v
+a = 2
+b = f(a)
+c = a * 3
+'''
+
+def test_incremental():
+    proc = processor(syn_t(), incremental=True)
+    proc.process(script)
+    calls = proc.working_dict['calls']
+    assert calls == [2]
+    # only the edited statement is processed again
+    proc.process(script.replace('a * 3', 'a * 4'))
+    assert calls == [2]
+    assert proc.working_dict['c'] == 8
+    # the dependents of an edited statement are processed again
+    proc.process(script.replace('a = 2', 'a = 5'))
+    assert calls == [2, 5]
+    assert proc.working_dict['c'] == 15
+    # with the globals read by the functions of the script
+    functions = 'k = 1\ndef g():\n    return k * 3\ndef f():\n    return g() + 1\nk = 2\ny = f()\n'
+    proc.process(functions)
+    assert proc.working_dict['y'] == 7
+    proc.process(functions.replace('k = 2', 'k = 5'))
+    assert proc.working_dict['y'] == 16
+
+def counted(v):
+    # not through a global, which would be a part of its cache key
+    counted.calls.append(v)
+    return v
+
+counted_calls = counted.calls = []
+
+def test_cache(tmp_path):
+    cached_script = 'a = 2\nb = counted(a) #m\n'
+    results = []
+    n_calls = []
+    for _ in range(2):
+        proc = processor(syn_t(), cache_dir=tmp_path, namespace={'counted': counted})
+        results.append(proc.process(cached_script))
+        n_calls.append(len(counted_calls))
+    # the second run is served from the cache
+    assert n_calls[0] and n_calls[1] == n_calls[0]
+    assert results[0] == results[1]
+    assert proc.working_dict['b'] == 2
+
+def test_cache_functions(tmp_path, monkeypatch):
+    import sys
+    import importlib
+    from docal import caching
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    cache_dir = tmp_path / 'cache'
+    helpers = 'import cached_other\ndef helper(v):\n    return v * {}\ndef scale(v):\n    return helper(v) + cached_other.offset()\n'
+    script = ('import cached_helper\nfrom cached_helper import scale\nk = 2\ndef g():\n    return k\n'
+              'a = scale(3)\nb = a + g()\nc = cached_helper.scale(1)\n')
+    values = []
+    for factor, offset, k in [(2, 0, 2), (10, 0, 2), (10, 10, 2), (10, 10, 3)]:
+        (tmp_path / 'cached_other.py').write_text(f'def offset():\n    return {offset}\n')
+        (tmp_path / 'cached_helper.py').write_text(helpers.format(factor))
+        importlib.invalidate_caches()
+        for name in ['cached_other', 'cached_helper']:
+            importlib.reload(importlib.import_module(name))
+        proc = processor(syn_t(), cache_dir=cache_dir)
+        proc.process(script.replace('k = 2', f'k = {k}'))
+        values.append([proc.working_dict[n] for n in 'abc'])
+    # editing a function, the helpers it calls, the modules it uses or the
+    # globals it reads changes the key
+    assert values == [[6, 8, 2], [30, 32, 10], [40, 42, 20], [40, 43, 20]]
+    # entries that cannot be written are skipped
+    def replace(src, dst):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(caching.os, 'replace', replace)
+    cache = caching.ResultCache(str(tmp_path / 'full'))
+    assert not cache.put('key', 1)
+    assert cache.get('key') is None and cache.size == 0
+    assert not list((tmp_path / 'full').iterdir())
+    proc = processor(syn_t(), cache_dir=tmp_path / 'full')
+    proc.process('c = 5 * 2')
+    assert proc.working_dict['c'] == 10
+
+def test_namespace():
+    base = {'k': 3}
+    def run(i):
+        proc = processor(syn_t(), namespace=base)
+        proc.process(f'x = k * {i}')
+        return proc.working_dict['x'], 'y' in proc.working_dict
+    proc = processor(syn_t())
+    proc.process('y = 1')
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(run, range(20)))
+    assert results == [(3 * i, False) for i in range(20)]
+    # the base is not modified
+    assert base == {'k': 3}
+
+def test_evaluate_once():
+    proc = processor(syn_t(), namespace={'counted': counted})
+    n_calls = len(counted_calls)
+    proc.process('a, (b, *c) = counted([1, [2, 3, 4]])\nd = e = counted(5)\nf = counted(6) #=a + 10')
+    assert len(counted_calls) == n_calls + 2
+    assert [proc.working_dict[n] for n in 'abcdef'] == [1, 2, [3, 4], 5, 5, 11]
+
+def test_render_to():
+    from docal.document.word import syntax as word_syn_t
+    content = '#foo\nx = counted(2) #m\n# x is #x\ny = x * 3\n#$ z = #y + 1\n'
+    separate = []
+    for syntax in [syn_t(), word_syn_t()]:
+        proc = processor(syntax, namespace={'counted': counted})
+        proc.send(content)
+        separate.append(proc.contents)
+    n_calls = len(counted_calls)
+    proc = processor(syn_t(), namespace={'counted': counted})
+    renderer = proc.render_to(word_syn_t())
+    proc.send(content)
+    # evaluated once for both
+    assert len(counted_calls) == n_calls + 1
+    assert [proc.contents, renderer.contents] == separate
+
+def test_steps():
+    proc = processor(syn_t())
+    rendered = [part[1] for _, part in proc.process('a = 2\nb = a * 3\nc = 2 * 3\nd = [1, 2]\ne = a * 4 #13')]
+    # the aligned steps are separated by new lines
+    assert [r.count('&=') for r in rendered] == [0, 3, 2, 0, 2]
+    assert rendered[4].endswith('&= 8\n\\end{aligned}\n\\]')
+    # the steps that render the same are not repeated
+    rendered = [part[1] for _, part in proc.process('c = -a\nh = [a, b]')]
+    assert rendered[0].count('- 2') == 1 and [r.count('&=') for r in rendered] == [2, 2]
+
+def test_units():
+    proc = processor(syn_t())
+    rendered = [part[1] for _, part in proc.process('F = 3 #N\nL = 2 #m\nk = F / L ** 2\nq = L ** -1\nM = F * L')]
+    assert rendered[2].endswith('\\mathrm{kg}/\\mathrm{m}\\,{\\mathrm{s}}^{2}\n\\end{aligned}\n\\]')
+    assert rendered[3].endswith('0.5/\\mathrm{m}\n\\end{aligned}\n\\]')
+    assert rendered[4].endswith('\\mathrm{kg}\\,{\\mathrm{m}}^{2}/{\\mathrm{s}}^{2}\n\\end{aligned}\n\\]')
+
+def test_unit_registry():
+    proc = processor(syn_t())
+    rendered = [part[1] for _, part in proc.process('F = 3 #N\nL = 2 #m\nM = 2 #N*m\nT = F * L\ndel M\nU = F * L')]
+    # the most recently used equivalent unit is chosen, while it is in use
+    assert rendered[3].endswith('\\mathrm{N}\\,\\mathrm{m}\n\\end{aligned}\n\\]')
+    assert rendered[-1].endswith('\\mathrm{N}\\,\\mathrm{m}\n\\end{aligned}\n\\]')
+    # and not after the variables that have it are deleted
+    rendered = proc.process('del T, U\nV = F * L')[0][1][1]
+    assert rendered.endswith('\\mathrm{kg}\\,{\\mathrm{m}}^{2}/{\\mathrm{s}}^{2}\n\\end{aligned}\n\\]')
+
+def test_sweep(tmp_path):
+    script = 'b = 0.2\nP = 10\nM = P * 3 / b\n'
+    cases = tmp_path / 'cases.csv'
+    cases.write_text('P,b\n1,0.5\n2,0.25\n')
+    proc = processor(syn_t())
+    expected = {'P': [1, 2], 'b': [0.5, 0.25], 'M': [6.0, 24.0]}
+    assert proc.sweep(script, cases, table='summary') == expected
+    assert proc.working_dict['summary'] == [['P', 'b', 'M'], [1, 0.5, 6.0], [2, 0.25, 24.0]]
+    # cannot be evaluated for all the cases at once
+    branched = script + 'if M > 10:\n    M = 0\n'
+    assert proc.sweep(branched, cases, workers=1) == {**expected, 'M': [6.0, 0]}
+    # a single case, rendered
+    proc = processor(syn_t(), overrides={'P': 2})
+    proc.process(script)
+    assert proc.working_dict['M'] == 30
+
+def test_sweep_reductions():
+    from docal.sweeping import sweep
+    cases = {'a': [1, 2, 5]}
+    script = 'import numpy as np\na = 1\navg = np.mean([a, 3 * a])\ntot = np.sum(a * 2)\nv = np.array([10, 20, 30])\nw = a * 2\n'
+    # not the same when evaluated at once, evaluated one by one
+    results = sweep(script, cases, columns=['avg', 'tot', 'v', 'w'], workers=1)
+    assert results['avg'] == [2, 4, 10] and results['tot'] == [2, 4, 10]
+    assert [list(v) for v in results['v']] == [[10, 20, 30]] * 3
+    assert results['w'] == [2, 4, 10]
+
+def test_profile():
+    proc = processor(syn_t(), profile=True)
+    proc.process('a = 2 #m\n# text\nfor i in range(2): pass\nb = a * 3')
+    entries = proc.profile.entries
+    assert [(e['line'], e['kind']) for e in entries] == [(1, 'assignment'), (2, 'text'), (3, 'statement'), (4, 'assignment')]
+    assert all(e['eval'] > 0 and e['units'] > 0 and e['render'] > 0 for e in [entries[0], entries[3]])
+    # the stages do not overlap
+    assert all(sum(e[s] for s in ['eval', 'units', 'render', 'write']) <= e['total'] for e in entries)
+    assert proc.profile.summary().splitlines()[0].split() == ['line', 'kind', 'total', 'eval', 'units', 'render', 'write']
+
+def test_stream(tmp_path):
+    proc = processor(syn_t())
+    parts = proc.stream('a = 1\nb = 2')
+    next(parts)
+    # rendered only as far as it is consumed
+    assert 'a' in proc.working_dict and 'b' not in proc.working_dict
+    infile = tmp_path / 'in.tex'
+    infile.write_text('start\n#foo\nmiddle\n#bar\n')
+    content = '#foo\nx = 2 #m\n# text\n#bar\ny = x * 3\n'
+    outputs = []
+    for stream in [False, True]:
+        doc = doc_t(infile, tmp_path / f'out-{stream}.tex')
+        proc = processor(syn_t(), doc.tags)
+        if stream:
+            doc.write(proc.stream(content))
+        else:
+            proc.send(content)
+            doc.write(proc.contents)
+        outputs.append((tmp_path / f'out-{stream}.tex').read_text())
+    assert outputs[0] == outputs[1]
+    assert '#' not in outputs[1] and '6\\mathrm{m}' in outputs[1]
+
+def test_big_matrix():
+    numpy = pytest.importorskip('numpy')
+    proc = processor(syn_t(), namespace={'np': numpy})
+    rendered = [part[1] for _, part in proc.process('A = np.arange(10000).reshape(100, 100)\nv = np.arange(50) #m6\ns = sum(v) #12')]
+    # only the corners are shown
+    assert rendered[0].count(r'\cdots') == 8 and r'\ddots' in rendered[0]
+    assert '9.999\\left({10}^{3}\\right)\n\\end{matrix}' in rendered[0]
+    # a long vector is cut in a single column
+    assert '\n3\\\\\n\\text{\\vdots}\\\\\n49\n\\end{matrix}' in rendered[1]
+    # the sum counts all the values
+    assert '\\sum_{i=1}^{50}' in rendered[2]
+
+def test_table_cells():
+    from docal.document import Tag
+    from docal.document.word import syntax as word_syn_t
+    values = [[1, -2, 3.14159, 0.0, -0.0], [12345.6, -1e-5, float('nan'), True, 'x']]
+    for syntax in [syn_t(), word_syn_t()]:
+        proc = processor(syntax)
+        proc.working_dict['t'] = values
+        table = proc._process_variable_tag(Tag('t', block=False, table=True))[0][1][1]
+        # the same as each value rendered alone
+        assert table == [[proc._format_value('t', value=value) for value in row] for row in values]
+    # with the decimal option like the inline values
+    proc = processor(syn_t(), [Tag('main', block=True, table=False), Tag('t', block=False, table=True),
+                               Tag('x', block=False, table=False)])
+    rendered = dict(proc.process('#@ d1\nt = [[3.14159]]\nx = 3.14159'))
+    assert rendered['t'][1] == [['\\(\\displaystyle 3.1\\,\\)']] and '3.1\\,' in rendered['x'][1]
+
+def test_math_tree():
+    from docal.document.word import syntax as word_syn_t
+    from docal.rendering import Math, MathSyntax, join, SMALL_SIZE
+    big = 'x' * (SMALL_SIZE + 1)
+    for syntax in [syn_t(), word_syn_t()]:
+        wrapped = MathSyntax(syntax)
+        # large ones are kept as trees
+        tree = wrapped.frac(wrapped.sup(big, 'a'), join(', ', [big, wrapped.prime(big, 'prime')]))
+        assert isinstance(tree, Math)
+        expected = syntax.frac(syntax.sup(big, 'a'), ', '.join([big, syntax.prime(big, 'prime')]))
+        assert wrapped.serialize(tree) == expected
+        # and the same for the forms given other values
+        tree = wrapped.delmtd(wrapped.matrix([wrapped.greek('alpha'), big], True), 3)
+        assert wrapped.serialize(tree) == syntax.delmtd(syntax.matrix([syntax.greek('alpha'), big], True), 3)
+    # the forms that look at their arguments are called with them
+    class parenthesized(syn_t):
+        def sup(self, base, s):
+            return super().sup(f'({base})' if base.startswith('-') else base, s)
+    syntax = parenthesized()
+    wrapped = MathSyntax(syntax)
+    tree = wrapped.frac(wrapped.sup('-' + big, 'a'), 'b')
+    assert wrapped.serialize(tree) == syntax.frac(syntax.sup('-' + big, 'a'), 'b')
+    # each thread gets the wrapper of its own syntax
+    from docal.parsing import to_math
+    syntaxes = [syn_t(), word_syn_t()] * 100
+    expected = [to_math('a_2 = sqrt(b**2 + c)', syntax=syntax) for syntax in syntaxes]
+    with ThreadPoolExecutor(4) as pool:
+        rendered = list(pool.map(lambda syntax: to_math('a_2 = sqrt(b**2 + c)', syntax=syntax), syntaxes))
+    assert rendered == expected
+
+@pytest.mark.parametrize('internals', [True, False])
+def test_word_package(tmp_path, monkeypatch, internals):
+    from io import BytesIO
+    from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+    from docal.document import zipio, word
+    from docal.document.word import document as word_doc_t, default_template
+    if not internals:
+        # as if ZipFile did not have them, decompressed and compressed again
+        monkeypatch.setattr(zipio, 'ZIPFILE_INTERNALS', ('_missing',))
+        monkeypatch.setattr(word, 'copy_member', None)
+    stream = BytesIO()
+
+    class Unseekable:
+        def write(self, data):
+            return stream.write(data)
+
+        def flush(self):
+            pass
+    # written with the sizes after the data, and some members stored
+    with ZipFile(BytesIO(default_template())) as zin, ZipFile(Unseekable(), 'w') as zout:
+        for info in zin.infolist():
+            zout.writestr(info, zin.read(info), ZIP_STORED if info.filename.endswith('.rels') else ZIP_DEFLATED)
+    infile = tmp_path / 'in.docx'
+    infile.write_bytes(stream.getvalue())
+    doc = word_doc_t(str(infile), str(tmp_path / 'out.docx'))
+    doc.write()
+    # nothing left next to it
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['in.docx', 'out.docx']
+    with ZipFile(infile) as zin, ZipFile(tmp_path / 'out.docx') as zout:
+        assert zout.testzip() is None
+        assert zout.namelist() == zin.namelist()
+        for info in zin.infolist():
+            if info.filename != 'word/document.xml':
+                # copied as they are
+                assert zout.getinfo(info.filename).compress_type == info.compress_type
+                assert zout.read(info.filename) == zin.read(info)
+        # the namespaces declared on the root are kept, even if unused
+        root = [re.search(rb'<w:document[^>]*>', z.read('word/document.xml')).group(0) for z in [zin, zout]]
+        assert set(re.findall(rb'xmlns:\w+', root[0])) <= set(re.findall(rb'xmlns:\w+', root[1]))
+
+def _word_input(infile, body: str):
+    '''a word document with the body xml added to the default template'''
+    from io import BytesIO
+    from zipfile import ZipFile
+    from docal.document.word import default_template
+    with ZipFile(BytesIO(default_template())) as zin, ZipFile(infile, 'w') as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename == 'word/document.xml':
+                data = data.replace(b'<w:body>', b'<w:body>' + body.encode())
+            zout.writestr(info, data)
+
+def _paragraph(text: str) -> str:
+    return f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>'
+
+def test_word_stream(tmp_path):
+    from zipfile import ZipFile
+    import xml.etree.ElementTree as ET
+    from docal.document.word import document as word_doc_t, syntax as word_syn_t
+    untagged = '<w:p><w:bookmarkStart w:id="0" w:name="b"/><w:r><w:t>plain</w:t></w:r><w:bookmarkEnd w:id="0"/></w:p>'
+    infile = tmp_path / 'in.docx'
+    _word_input(infile, _paragraph('#foo') + _paragraph('x is #x here') + untagged)
+    texts = []
+    for stream in [False, True]:
+        outfile = tmp_path / f'out-{stream}.docx'
+        doc = word_doc_t(str(infile), str(outfile), stream=stream)
+        proc = processor(word_syn_t(), doc.tags)
+        doc.write(proc.stream('#foo\ny = 2 #m\nx = 3'))
+        with ZipFile(outfile) as zout:
+            xml = zout.read('word/document.xml')
+        texts.append(''.join(ET.fromstring(xml).itertext()))
+    assert texts[0] == texts[1] and '#' not in texts[1] and 'x is 3' in texts[1]
+    # the rest is copied as it is
+    assert untagged.encode() in xml
+
+def test_word_subs(tmp_path):
+    from zipfile import ZipFile
+    import xml.etree.ElementTree as ET
+    from docal.document.word import document as word_doc_t, syntax as word_syn_t
+    cells = [[_paragraph('h'), _paragraph('#t') + _paragraph('old') + _paragraph('old')], [_paragraph('k'), _paragraph('old')]]
+    table = '<w:tbl>' + ''.join('<w:tr>' + ''.join(f'<w:tc>{c}</w:tc>' for c in row) + '</w:tr>' for row in cells) + '</w:tbl>'
+    infile = tmp_path / 'in.docx'
+    _word_input(infile, _paragraph('#a') + _paragraph('#b') + table + _paragraph('v is #v.'))
+    w = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    for stream in [False, True]:
+        outfile = tmp_path / f'out-{stream}.docx'
+        doc = word_doc_t(str(infile), str(outfile), stream=stream)
+        proc = processor(word_syn_t(), doc.tags)
+        doc.write(proc.stream('#a\nx = 1\ny = 2\n#b\nz = 3\nv = 4 #;\nt = [[1, 2], [3, 4], [5, 6]] #;'))
+        with ZipFile(outfile) as zout:
+            body = ET.fromstring(zout.read('word/document.xml'))[0]
+        # in the order they were sent, where they were sent to
+        assert [''.join(p.itertext())[:3] for p in body.findall(w + 'p')] == ['x=1', 'y=2', 'z=3', 'v i', '']
+        # filled from the cell of the tag, with a new row as wide as the others
+        rows = [[[''.join(p.itertext()).strip() for p in tc.findall(w + 'p')] for tc in tr.findall(w + 'tc')]
+                for tr in body.find(w + 'tbl').findall(w + 'tr')]
+        assert rows == [[['h'], ['1'], ['2']], [['k'], ['3'], ['4']], [[], ['5'], ['6']]]
+    # without an input, the section properties stay last
+    doc = word_doc_t(None, str(tmp_path / 'new.docx'))
+    proc = processor(word_syn_t(), doc.tags)
+    doc.write(proc.stream('x = 1\ny = 2'))
+    with ZipFile(tmp_path / 'new.docx') as zout:
+        body = ET.fromstring(zout.read('word/document.xml'))[0]
+    assert [child.tag for child in body] == [w + 'p', w + 'p', w + 'sectPr']
+
+def test_word_template(tmp_path, monkeypatch):
+    from zipfile import ZipFile
+    import xml.etree.ElementTree as ET
+    from docal.document import word
+    infile = tmp_path / 'in.docx'
+    _word_input(infile, _paragraph('#foo') + _paragraph('x is #x here') + _paragraph('plain'))
+    compiled = word.template(str(infile))
+
+    def parse(*args, **kwargs):
+        raise AssertionError('parsed again')
+    # the template is not parsed to render it
+    monkeypatch.setattr(word.expat, 'ParserCreate', parse)
+    monkeypatch.setattr(word.ET, 'iterparse', parse)
+    texts = []
+    for x in [3, 4]:
+        doc = compiled.document(tmp_path / f'out-{x}.docx')
+        proc = processor(word.syntax(), doc.tags)
+        doc.write(proc.stream(f'#foo\ny = {x * 2}\nx = {x}'))
+        with ZipFile(tmp_path / f'out-{x}.docx') as zout:
+            texts.append(''.join(ET.fromstring(zout.read('word/document.xml')).itertext()))
+    # each from the template as it was
+    assert texts[0].replace('3', '4').replace('6', '8') == texts[1]
+    assert texts[0].startswith('y=6x=3x is 3') and texts[0].endswith('hereplain')
+
+def test_document_bytes(tmp_path, monkeypatch):
+    from io import BytesIO
+    from zipfile import ZipFile
+    import xml.etree.ElementTree as ET
+    from docal.document import word
+    infile = tmp_path / 'in.docx'
+    _word_input(infile, _paragraph('#foo') + _paragraph('x is #x here'))
+    data = infile.read_bytes()
+    # not on the disk at all
+    monkeypatch.chdir(tmp_path)
+    infile.unlink()
+    for made in [lambda: word.document(data), lambda: word.document(BytesIO(data)),
+                 lambda: word.template(data).document()]:
+        doc = made()
+        doc.write(processor(word.syntax(), doc.tags).stream('#foo\nx = 3'))
+        with ZipFile(doc.outfile) as zout:
+            assert 'x is 3' in ''.join(ET.fromstring(zout.read('word/document.xml')).itertext())
+    out = BytesIO()
+    doc = doc_t(BytesIO('start\n#foo\n'.encode()), out)
+    doc.write(processor(syn_t(), doc.tags).stream('#foo\nx = 2'))
+    assert out.getvalue() == b'start\n\\[\nx=2\n\\]\n'
+    assert not list(tmp_path.iterdir())
+
+def test_word_compression(tmp_path, monkeypatch):
+    from zipfile import ZipFile, ZIP_STORED
+    from docal.document import word, zipio
+    infile = tmp_path / 'in.docx'
+    _word_input(infile, _paragraph('#foo') + ''.join(_paragraph(f'text {i}') for i in range(500)))
+    outputs = []
+    for name, options in [('default', {}), ('stored', {'compression': ZIP_STORED}), ('parallel', {}),
+                          ('fallback', {})]:
+        if name == 'parallel':
+            # in many small pieces
+            monkeypatch.setattr(word, 'PARALLEL_SIZE', 0)
+            monkeypatch.setattr(zipio, 'CHUNK_SIZE', 1000)
+        elif name == 'fallback':
+            # as if zipfile did not compress with zlib objects, in this thread
+            monkeypatch.setattr(zipio, 'ZLIB_COMPRESSOR', type('Other', (), {}))
+            monkeypatch.setattr(word, 'ParallelCompressor', None)
+        doc = word.document(str(infile), str(tmp_path / f'{name}.docx'), **options)
+        doc.write(processor(word.syntax(), doc.tags).stream('#foo\nx = 3'))
+        with ZipFile(tmp_path / f'{name}.docx') as zout:
+            assert zout.testzip() is None
+            outputs.append({info.filename: (info.compress_type, zout.read(info)) for info in zout.infolist()})
+    assert all(kind == ZIP_STORED for kind, _ in outputs[1].values())
+    contents = [{name: data for name, (_, data) in output.items()} for output in outputs]
+    assert contents[0] == contents[1] == contents[2] == contents[3]
+
+def test_word_zip64(tmp_path, monkeypatch):
+    import zipfile
+    from docal.document import word
+    infile = tmp_path / 'in.docx'
+    _word_input(infile, _paragraph('#foo'))
+    with zipfile.ZipFile(infile) as zin:
+        size = zin.getinfo('word/document.xml').file_size
+    # the rendered part passes the limit while the one of the input does not
+    monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', int(size * 1.1))
+    for stream in [False, True]:
+        outfile = tmp_path / f'out-{stream}.docx'
+        doc = word.document(str(infile), str(outfile), stream=stream)
+        doc.write(processor(word.syntax(), doc.tags).stream('#foo\n' + '\n'.join(f'x_{i} = {i}' for i in range(50))))
+        with zipfile.ZipFile(outfile) as zout:
+            assert zout.testzip() is None
+            assert zout.getinfo('word/document.xml').file_size > zipfile.ZIP64_LIMIT
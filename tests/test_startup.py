@@ -0,0 +1,61 @@
+import sys
+import json
+import subprocess
+
+# the time to import the command line tool and render a small document
+BUDGET = 0.1
+
+run = '''
+import sys, json, time
+start = time.perf_counter()
+from docal.__main__ import main
+main(sys.argv[1:])
+print(json.dumps([time.perf_counter() - start, list(sys.modules)]))
+'''
+
+def test_startup(tmp_path):
+    script = tmp_path / 'calc.py'
+    script.write_text('x = 1\n#$ x\n')
+    times = []
+    for _ in range(3):
+        # in a new process each time, to import everything again
+        result = subprocess.run([sys.executable, '-c', run, str(script), '-o', str(tmp_path / 'out.tex')],
+                                capture_output=True, text=True, check=True)
+        elapsed, modules = json.loads(result.stdout.splitlines()[-1])
+        times.append(elapsed)
+    assert (tmp_path / 'out.tex').exists()
+    # only the backend that is used is imported
+    assert 'docal.document.latex' in modules
+    for module in ['docal.document.word', 'docal.parsers.excel', 'docal.parsers.dcl',
+                   'concurrent.futures.process', 'importlib.metadata']:
+        assert module not in modules
+    assert min(times) < BUDGET
+
+def test_exit_status(tmp_path, capsys):
+    from docal.__main__ import main
+    script = tmp_path / 'calc.py'
+    script.write_text('x = 1 / 0\n')
+    manifest = tmp_path / 'jobs.json'
+    manifest.write_text(json.dumps([{'script': 'calc.py', 'output': 'out.tex'}]))
+    # a failed job is an error for the caller
+    assert main(['--batch', str(manifest), '--jobs', '1']) == 1
+    assert 'division by zero' in capsys.readouterr().err
+    script.write_text('x = 1\n')
+    assert main(['--batch', str(manifest), '--jobs', '1']) == 0
+    # and so is a failed case of a sweep
+    script.write_text('a = 1\nx = 1 / a\n')
+    cases = tmp_path / 'cases.csv'
+    cases.write_text('a\n1\n0\n')
+    assert main([str(script), '--cases', str(cases), '-o', str(tmp_path / 'out.tex'), '--jobs', '1']) == 1
+    assert 'division by zero' in capsys.readouterr().err
+
+def test_profile_options(tmp_path, capsys):
+    from docal.__main__ import main
+    script = tmp_path / 'calc.py'
+    script.write_text('x = 1\n#$ x\n')
+    # the script is not taken as the file of the times
+    assert main(['--profile', str(script), '-o', str(tmp_path / 'out.tex')]) == 0
+    assert script.read_text() == 'x = 1\n#$ x\n' and (tmp_path / 'out.tex').exists()
+    times = tmp_path / 'times.json'
+    assert main([str(script), '--profile-json', str(times), '-o', str(tmp_path / 'out.tex')]) == 0
+    assert json.loads(times.read_text())